@@ -1,6 +1,15 @@
 from django.contrib import admin
-from .models import Movie
+from .models import Genre, Movie, MovieNeighbor
 
 # Register your models here.
 
-admin.site.register(Movie)
+
+@admin.register(Movie)
+class MovieAdmin(admin.ModelAdmin):
+    # `genres` se deriva del texto de `genre` en Movie.save (sync_genres): si fuera editable,
+    # save_m2m del formulario lo sobrescribiría con los valores anteriores
+    readonly_fields = ('genres',)
+
+
+admin.site.register(MovieNeighbor)
+admin.site.register(Genre)
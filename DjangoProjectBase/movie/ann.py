@@ -0,0 +1,325 @@
+"""
+Approximate nearest-neighbor search over the movie embeddings.
+
+``IVFIndex`` is an inverted-file index: the (L2-normalized) vectors are
+clustered with spherical k-means into ``nlist`` cells and a query only scores
+the vectors of its ``nprobe`` closest cells. ``nlist`` and ``nprobe`` are the
+recall/latency knobs: more probes means higher recall and slower queries.
+
+``ann_index`` is the process-level instance used by the recommendation views
+when ``settings.MOVIE_SEARCH_BACKEND == 'ivf'``. It is loaded from
+``settings.MOVIE_ANN_INDEX_PATH`` (built with ``manage.py build_ann_index``),
+reloaded when that file changes and updated incrementally when a movie is
+saved or deleted. Updates are applied to a copy (``IVFIndex.copy``) that then
+replaces the index, so searches run without the lock and never see a
+half-applied change. Until the file exists, or when it was built by another
+embedding provider (see ``providers.py``) or for another dimension, queries
+fall back to the exact search in ``index.py``; the index is never trained
+inside a request.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .embeddings import normalize, top_k
+
+ASSIGN_BLOCK_SIZE = 4096
+
+logger = logging.getLogger(__name__)
+
+
+def _assign(vectors, centroids):
+    """Index of the closest centroid for each row, computed in blocks to bound memory."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors, nlist, iterations=20, max_train_size=None, seed=0):
+    """Spherical k-means over (a sample of) ``vectors``; returns ``nlist`` unit centroids."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        raise ValueError("No vectors to train the IVF centroids on")
+    if max_train_size and len(vectors) > max_train_size:
+        vectors = vectors[rng.choice(len(vectors), max_train_size, replace=False)]
+
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Las celdas vacías se reinician con vectores al azar
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+
+    def __init__(self, centroids, nprobe=8, backend=''):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        # Clave del proveedor que generó los vectores (providers.EmbeddingProvider.key)
+        self.backend = backend
+        # Buffers con capacidad extra para que las inserciones no copien todo el índice
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._row_of = {}
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=64, nprobe=8, iterations=20, seed=0, backend=''):
+        vectors = normalize(vectors)
+        centroids = train_centroids(vectors, nlist, iterations=iterations,
+                                    max_train_size=nlist * 256, seed=seed)
+        index = cls(centroids, nprobe=nprobe, backend=backend)
+        index.add(ids, vectors)
+        return index
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    @property
+    def assignments(self):
+        return self._assignments[:self._size]
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, 2 * len(self._ids), 1024)
+        for name in ('_ids', '_vectors', '_assignments'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _rebuild_lists(self):
+        ids = self.ids
+        self._row_of = {int(movie_id): row for row, movie_id in enumerate(ids) if movie_id >= 0}
+        order = np.argsort(self.assignments, kind='stable')
+        order = order[ids[order] >= 0]
+        bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def add(self, ids, vectors):
+        """Insert (or replace) vectors without retraining the centroids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        vectors = normalize(np.atleast_2d(vectors))
+        assignments = _assign(vectors, self.centroids)
+
+        # Las versiones anteriores de los ids se marcan como borradas (id = -1)
+        self._tombstone(ids)
+        self._reserve(len(ids))
+        start = self._size
+        self._ids[start:start + len(ids)] = ids
+        self._vectors[start:start + len(ids)] = vectors
+        self._assignments[start:start + len(ids)] = assignments
+        self._size += len(ids)
+
+        rows = np.arange(start, start + len(ids))
+        for row, movie_id in zip(rows, ids):
+            self._row_of[int(movie_id)] = int(row)
+        for cell in np.unique(assignments):
+            self._lists[cell] = np.concatenate([self._lists[cell], rows[assignments == cell]])
+        self._compact_if_needed()
+
+    def remove(self, ids):
+        self._tombstone(ids)
+        self._compact_if_needed()
+
+    def copy(self):
+        """
+        Index that can be modified while searches keep using this one. Only the
+        ids (tombstones are written in place), the row map and the cell lists
+        are copied: vectors and assignments are append-only, so both indexes
+        share them and this one gives up its spare capacity (its next ``add``
+        reallocates instead of writing the rows the copy appends).
+        """
+        index = IVFIndex(self.centroids, nprobe=self.nprobe, backend=self.backend)
+        self._ids = self.ids
+        self._vectors = self.vectors
+        self._assignments = self.assignments
+        index._ids = self.ids.copy()
+        index._vectors = self._vectors
+        index._assignments = self._assignments
+        index._size = self._size
+        index._row_of = dict(self._row_of)
+        index._lists = list(self._lists)
+        return index
+
+    def _tombstone(self, ids):
+        for movie_id in ids:
+            row = self._row_of.pop(int(movie_id), None)
+            if row is not None:
+                self._ids[row] = -1
+
+    def _compact_if_needed(self):
+        if len(self) >= 0.75 * self._size:
+            return
+        live = self.ids >= 0
+        self._ids = self.ids[live]
+        self._vectors = self.vectors[live]
+        self._assignments = self.assignments[live]
+        self._size = len(self._ids)
+        self._rebuild_lists()
+
+    def search(self, query, k=1, nprobe=None):
+        """Return up to ``k`` ``(movie_id, similarity)`` pairs, best first."""
+        if not len(self):
+            return []
+        query = normalize(query)
+        if query.shape[0] != self.dim:
+            raise ValueError(
+                f"Query embedding has {query.shape[0]} dimensions, index has {self.dim}"
+            )
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        cells = top_k(self.centroids @ query, nprobe)
+        rows = np.concatenate([self._lists[c] for c in cells])
+        rows = rows[self._ids[rows] >= 0]
+        scores = self._vectors[rows] @ query
+        top = top_k(scores, k)
+        return [(int(self._ids[rows[i]]), float(scores[i])) for i in top]
+
+    def save(self, path):
+        """Write the index to ``path`` atomically (temporary file + rename)."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        live = self.ids >= 0
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, ids=self.ids[live],
+                     vectors=self.vectors[live], assignments=self.assignments[live],
+                     nprobe=np.array(self.nprobe), backend=np.array(self.backend))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        with np.load(path) as data:
+            backend = str(data['backend']) if 'backend' in data.files else ''
+            index = cls(data['centroids'], nprobe=int(nprobe or data['nprobe']), backend=backend)
+            index._ids = data['ids']
+            index._vectors = data['vectors']
+            index._assignments = data['assignments']
+        index._size = len(index._ids)
+        index._rebuild_lists()
+        return index
+
+
+class AnnIndex:
+    """Lazily loaded, process-level ``IVFIndex`` backed by ``settings.MOVIE_ANN_INDEX_PATH``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._mtime = None
+
+    @property
+    def path(self):
+        return str(settings.MOVIE_ANN_INDEX_PATH)
+
+    @property
+    def loaded(self):
+        return self._index is not None
+
+    def get(self):
+        """The loaded index, or ``None`` if it has not been built for the active provider."""
+        from .providers import get_provider
+
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._index = None
+                if mtime is not None:
+                    index = IVFIndex.load(self.path, nprobe=settings.MOVIE_ANN_NPROBE)
+                    key = get_provider().key
+                    if index.backend and index.backend != key:
+                        logger.warning("ANN index %s was built for %r, the active provider is %r; "
+                                       "using exact search until `manage.py build_ann_index` is run",
+                                       self.path, index.backend, key)
+                    else:
+                        self._index = index
+                self._mtime = mtime
+            return self._index
+
+    def __len__(self):
+        index = self.get()
+        return len(index) if index is not None else 0
+
+    def usable(self, dim):
+        """True when a loaded index can answer queries of ``dim`` dimensions."""
+        index = self.get()
+        return index is not None and index.dim == dim
+
+    def search(self, query, k=1, nprobe=None, fallback=None):
+        index = self.get()
+        if index is None or len(query) != index.dim:
+            # Sin índice entrenado (o de otra dimensión): búsqueda exacta en fallback
+            if fallback is None:
+                from .index import embedding_index as fallback
+            return fallback.search(query, k=k)
+        return index.search(query, k=k, nprobe=nprobe)
+
+    def upsert(self, movie_id, vector):
+        """Apply a saved embedding to the in-memory index, if it is loaded."""
+        with self._lock:
+            if self._index is not None and len(vector) == self._index.dim:
+                # Copia: las búsquedas en curso (sin lock) siguen usando el índice anterior
+                index = self._index.copy()
+                index.add([movie_id], vector)
+                self._index = index
+
+    def remove(self, movie_id):
+        with self._lock:
+            if self._index is not None and int(movie_id) in self._index._row_of:
+                index = self._index.copy()
+                index.remove([movie_id])
+                self._index = index
+
+
+ann_index = AnnIndex()
+
+
+def update_persisted_index(ids, vectors, backend=''):
+    """Insert freshly embedded movies into the index file on disk, if one has been built for ``backend``."""
+    path = str(settings.MOVIE_ANN_INDEX_PATH)
+    if not len(ids) or not os.path.exists(path):
+        return False
+    index = IVFIndex.load(path)
+    if (index.backend and index.backend != backend) or np.shape(vectors)[1] != index.dim:
+        return False
+    index.add(ids, vectors)
+    index.save(path)
+    return True
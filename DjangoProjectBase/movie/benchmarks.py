@@ -0,0 +1,106 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import heapq
+import time
+import tracemalloc
+
+import numpy as np
+
+from .embeddings import from_blob, normalize
+
+
+def synthetic_embeddings(n, dim=1536, clusters=None, seed=0):
+    """
+    ``n`` normalized vectors drawn around random cluster centers, which gives
+    a neighbor structure closer to real text embeddings than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, int(np.sqrt(n)))
+    centers = normalize(rng.standard_normal((clusters, dim), dtype=np.float32))
+    matrix = np.empty((n, dim), dtype=np.float32)
+    block = 65536
+    for start in range(0, n, block):
+        size = min(block, n - start)
+        labels = rng.integers(0, clusters, size)
+        noise = rng.standard_normal((size, dim), dtype=np.float32) * (1.5 / np.sqrt(dim))
+        matrix[start:start + size] = normalize(centers[labels] + noise)
+    return matrix
+
+
+def sample_queries(matrix, count, noise=0.5, seed=1):
+    """Perturbed copies of random rows, so a query is close to, but not exactly, a stored vector."""
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.choice(len(matrix), min(count, len(matrix)), replace=False)]
+    perturbation = rng.standard_normal(rows.shape, dtype=np.float32) * (noise / np.sqrt(matrix.shape[1]))
+    return normalize(rows + perturbation)
+
+
+def recall_at_k(expected, found):
+    """Fraction of the exact top-k ids that the approximate search also returned."""
+    expected = list(expected)
+    if not expected:
+        return 1.0
+    return len(set(expected) & set(found)) / len(expected)
+
+
+def time_queries(search, queries):
+    """Run ``search(query)`` for every query; return the results and per-query latencies in seconds."""
+    results = []
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies[i] = time.perf_counter() - start
+    return results, latencies
+
+
+def latency_summary(latencies):
+    """p50/p95/p99/mean latency in milliseconds and single-thread throughput in queries per second."""
+    latencies = np.asarray(latencies)
+    total = latencies.sum()
+    return {
+        'p50_ms': float(1000 * np.percentile(latencies, 50)),
+        'p95_ms': float(1000 * np.percentile(latencies, 95)),
+        'p99_ms': float(1000 * np.percentile(latencies, 99)),
+        'mean_ms': float(1000 * latencies.mean()),
+        'qps': float(len(latencies) / total) if total else 0.0,
+    }
+
+
+def traced_peak_mb(fn):
+    """
+    Run ``fn()`` and return ``(result, peak MiB allocated while it ran)``,
+    measured with tracemalloc (NumPy buffers included) from the memory in use
+    when it started, so each path is measured on its own.
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return result, (peak - current) / 2**20
+
+
+def legacy_orm_search(query, k=1):
+    """
+    Top-k movie ids computed like the original ``recommendations_view``: one
+    ORM row, one ``np.frombuffer`` and one cosine similarity per movie.
+    """
+    from .models import Movie
+
+    query_norm = np.linalg.norm(query)
+    scored = []
+    for movie in Movie.objects.all():
+        emb = from_blob(movie.emb)
+        if emb.shape != query.shape:
+            continue
+        similarity = np.dot(query, emb) / (query_norm * np.linalg.norm(emb))
+        scored.append((similarity, movie.id))
+    return [movie_id for _, movie_id in heapq.nlargest(k, scored)]
@@ -0,0 +1,300 @@
+"""
+Two-tier cache for the embeddings of recommendation prompts.
+
+Lookups go first to a bounded in-process LRU and then to a SQLite file shared
+by every worker that survives restarts (``settings.MOVIE_PROMPT_CACHE_PATH``).
+Entries expire after ``MOVIE_PROMPT_CACHE_TTL`` seconds and the oldest ones
+are evicted once the file holds more than ``MOVIE_PROMPT_CACHE_MAX_ENTRIES``.
+Keys are a hash of the embedding model name and the normalized prompt text,
+so "Película  de  GUERRA" and "película de guerra" share an entry.
+
+``APICache`` is the content-addressed cache shared by the management commands
+that call OpenAI (completions, embeddings and generated images). Entries are
+keyed by a hash of the endpoint, model, parameters and input, stored in
+``settings.MOVIE_API_CACHE_PATH`` and evicted least-recently-used once the
+file holds more than ``MOVIE_API_CACHE_MAX_BYTES``. With ``cache_only=True`` a
+miss raises ``CacheMiss`` instead of calling the API.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .embeddings import EMBEDDING_DTYPE, from_blob, to_blob
+
+
+def normalize_prompt(text):
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.lower().split())
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Key/bytes store in a SQLite file, safe to share between threads and processes."""
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path, ttl=None, max_entries=None, max_bytes=None):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+                ' created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value, created FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        now = time.time()
+        if self.ttl and created + self.ttl < now:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+            (key, value, now, now),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and, beyond ``max_entries`` or ``max_bytes``, the least recently used ones."""
+        conn = self._connection()
+        if self.ttl:
+            conn.execute('DELETE FROM cache WHERE created < ?', (time.time() - self.ttl,))
+        if self.max_entries:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+        if self.max_bytes:
+            # Tamaño acumulado desde la entrada más reciente: se borra lo que excede el límite
+            conn.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM (SELECT key, SUM(length(value)) OVER (ORDER BY accessed DESC) AS total'
+                ' FROM cache) WHERE total > ?)',
+                (self.max_bytes,),
+            )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class PromptEmbeddingCache:
+
+    def __init__(self):
+        self._memory = None
+        self._disk = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _tiers(self):
+        with self._lock:
+            if self._memory is None:
+                self._disk = SQLiteCache(settings.MOVIE_PROMPT_CACHE_PATH, ttl=settings.MOVIE_PROMPT_CACHE_TTL,
+                                         max_entries=settings.MOVIE_PROMPT_CACHE_MAX_ENTRIES)
+                self._memory = LRUCache(settings.MOVIE_PROMPT_CACHE_SIZE, ttl=settings.MOVIE_PROMPT_CACHE_TTL)
+            return self._memory, self._disk
+
+    @staticmethod
+    def key(prompt, model):
+        text = f'{model}\0{normalize_prompt(prompt)}'
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, prompt, model):
+        memory, disk = self._tiers()
+        key = self.key(prompt, model)
+        vector = memory.get(key)
+        if vector is not None:
+            self._count('memory_hits')
+            return vector
+        blob = disk.get(key)
+        if blob is not None:
+            self._count('disk_hits')
+            vector = from_blob(blob)
+            memory.set(key, vector)
+            return vector
+        self._count('misses')
+        return None
+
+    def set(self, prompt, model, vector):
+        memory, disk = self._tiers()
+        key = self.key(prompt, model)
+        vector = np.asarray(vector, dtype=EMBEDDING_DTYPE)
+        memory.set(key, vector)
+        disk.set(key, to_blob(vector))
+
+    def get_or_compute(self, prompt, model, compute):
+        """Return the cached embedding of ``prompt`` or call ``compute(prompt)`` and store it."""
+        vector = self.get(prompt, model)
+        if vector is None:
+            vector = np.asarray(compute(prompt), dtype=EMBEDDING_DTYPE)
+            self.set(prompt, model, vector)
+        return vector
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptEmbeddingCache()
+
+
+class CacheMiss(LookupError):
+    """Raised in cache-only mode when a request has no cached response."""
+
+
+class APICache:
+
+    def __init__(self):
+        self._disk = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self):
+        with self._lock:
+            if self._disk is None:
+                self._disk = SQLiteCache(settings.MOVIE_API_CACHE_PATH, max_bytes=settings.MOVIE_API_CACHE_MAX_BYTES)
+            return self._disk
+
+    @staticmethod
+    def key(endpoint, request):
+        """Hash of the endpoint and the request (model, parameters and input)."""
+        text = json.dumps({'endpoint': endpoint, 'request': request}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def get(self, endpoint, request):
+        """Cached bytes for ``request``, or None."""
+        value = self._store().get(self.key(endpoint, request))
+        self._count('misses' if value is None else 'hits')
+        return None if value is None else bytes(value)
+
+    def set(self, endpoint, request, value):
+        self._store().set(self.key(endpoint, request), value)
+
+    def get_or_compute(self, endpoint, request, compute, cache_only=False):
+        """Cached bytes for ``request`` or the result of ``compute()``, which must return bytes."""
+        value = self.get(endpoint, request)
+        if value is not None:
+            return value
+        if cache_only:
+            raise CacheMiss(f"No cached response for {endpoint} ({request.get('model')})")
+        value = compute()
+        self.set(endpoint, request, value)
+        return value
+
+    def text(self, endpoint, request, compute, cache_only=False):
+        return self.get_or_compute(endpoint, request, lambda: compute().encode('utf-8'), cache_only).decode('utf-8')
+
+    def embeddings(self, model, texts, compute, cache_only=False):
+        """
+        Embeddings of ``texts`` (one row each). Only the texts missing from the
+        cache are sent to ``compute(texts)``, in a single batch.
+        """
+        store = self._store()
+        keys = [self.key('embeddings', {'model': model, 'input': text}) for text in texts]
+        rows = [store.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        self._count('hits', len(rows) - len(missing))
+        self._count('misses', len(missing))
+        if missing:
+            if cache_only:
+                raise CacheMiss(f"{len(missing)} of {len(texts)} embeddings are not cached ({model})")
+            vectors = compute([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                rows[i] = to_blob(vector)
+                store.set(keys[i], rows[i])
+        return np.array([from_blob(row) for row in rows], dtype=EMBEDDING_DTYPE)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+api_cache = APICache()
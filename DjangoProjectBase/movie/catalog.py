@@ -0,0 +1,80 @@
+"""
+Cross-process change detection for the in-memory indexes (``index.py``,
+``lexical.py``).
+
+``post_save``/``post_delete`` only reach the process that saved the movie, and
+``bulk_create``/``bulk_update`` send no signals at all. ``version()`` is a
+cheap fingerprint of the catalog: the number of movies, the largest id and
+``emb_version`` (one aggregate query) plus the random token stored in a stamp
+file (``settings.MOVIE_CATALOG_STAMP_PATH``) that the signals (once the
+transaction commits) and the commands that write movies in bulk ``touch()``.
+A token, unlike the file's mtime, changes on every touch whatever the
+timestamp resolution of the filesystem. An index rebuilds itself when the
+fingerprint differs from the one it was built with.
+
+``current_version()`` caches the fingerprint for
+``settings.MOVIE_CATALOG_CHECK_INTERVAL`` seconds, so a request runs at most
+one aggregate query per interval.
+"""
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+
+def stamp_path():
+    return str(settings.MOVIE_CATALOG_STAMP_PATH)
+
+
+def touch():
+    """Tell every process that the movies changed."""
+    path = stamp_path()
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    # Archivo temporal + rename: un lector ve el token anterior o el nuevo, nunca uno a medias
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(16))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    with _lock:
+        _checked.clear()
+
+
+def stamp_token():
+    try:
+        with open(stamp_path()) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def version():
+    from .models import Movie
+
+    stats = Movie.objects.aggregate(count=Count('id'), max_id=Max('id'), max_emb_version=Max('emb_version'))
+    return stats['count'], stats['max_id'], stats['max_emb_version'], stamp_token()
+
+
+_lock = threading.Lock()
+_checked = {}  # 'version' -> (instante de la consulta, huella)
+
+
+def current_version():
+    """``version()``, queried again at most every ``MOVIE_CATALOG_CHECK_INTERVAL`` seconds."""
+    now = time.monotonic()
+    with _lock:
+        cached = _checked.get('version')
+    if cached is not None and now - cached[0] < settings.MOVIE_CATALOG_CHECK_INTERVAL:
+        return cached[1]
+    current = version()
+    with _lock:
+        _checked['version'] = (now, current)
+    return current
@@ -0,0 +1,101 @@
+"""
+Bar charts for the statistics page.
+
+Charts are drawn with matplotlib's object-oriented API (a ``Figure`` per
+chart, no ``pyplot`` global state), so concurrent requests in a threaded
+server cannot draw on each other's figure. The base64 PNG is cached under a
+hash of the data and labels: a chart is only rendered again when its counts
+change.
+
+The aggregated counts are cached too, keyed by a generation counter that the
+``post_save``/``post_delete`` signals bump (see ``signals.py``), and with a
+TTL (``settings.MOVIE_STATS_CACHE_TTL``) so other worker processes also pick
+up changes. A page load with unchanged data runs no query and renders
+nothing.
+"""
+import base64
+import hashlib
+import io
+import json
+import threading
+
+from django.conf import settings
+from django.db.models import Count, F
+from matplotlib.figure import Figure
+
+from .cache import LRUCache
+
+
+def render_bar_chart(data, xlabel, ylabel, title='Movies Distribution'):
+    """PNG bytes of a bar chart of ``data`` (label -> count)."""
+    figure = Figure()
+    axes = figure.subplots()
+    keys = [str(key) for key in data.keys()]
+    axes.bar(keys, list(data.values()))
+    axes.set_title(title)
+    axes.set_xlabel(xlabel)
+    axes.set_ylabel(ylabel)
+    axes.tick_params(axis='x', labelrotation=90)
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def movie_counts_by_year():
+    from .models import Movie
+
+    year_counts = (Movie.objects.values('year').annotate(count=Count('id'))
+                   .order_by(F('year').asc(nulls_last=True)))
+    counts = {}
+    for row in year_counts:
+        year = row['year'] if row['year'] else "None"
+        counts[year] = counts.get(year, 0) + row['count']
+    return counts
+
+
+def movie_counts_by_genre():
+    from .models import Movie
+
+    # Primer género de cada película (columna indexada first_genre)
+    genre_counts = Movie.objects.values('first_genre').annotate(count=Count('id')).order_by('first_genre')
+    return {row['first_genre'] or "None": row['count'] for row in genre_counts}
+
+
+class ChartCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._counts = None
+        self._charts = LRUCache(maxsize=64)
+
+    def invalidate(self):
+        """Drop the cached counts; charts are keyed by their data and need no invalidation."""
+        with self._lock:
+            self._generation += 1
+
+    def counts(self, name, compute):
+        """Cached result of ``compute()`` for the current generation."""
+        with self._lock:
+            if self._counts is None:
+                self._counts = LRUCache(maxsize=16, ttl=settings.MOVIE_STATS_CACHE_TTL)
+            key = (name, self._generation)
+        value = self._counts.get(key)
+        if value is None:
+            value = compute()
+            self._counts.set(key, value)
+        return value
+
+    def bar_chart(self, data, xlabel, ylabel, title='Movies Distribution'):
+        """Base64 PNG of the chart, rendered only if this exact data has not been drawn before."""
+        payload = json.dumps([[str(key), value] for key, value in data.items()] + [xlabel, ylabel, title])
+        key = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        graphic = self._charts.get(key)
+        if graphic is None:
+            graphic = base64.b64encode(render_bar_chart(data, xlabel, ylabel, title)).decode('utf-8')
+            self._charts.set(key, graphic)
+        return graphic
+
+
+chart_cache = ChartCache()
@@ -0,0 +1,199 @@
+"""
+Compact copies of the embedding matrix used as a candidate-search tier.
+
+``CompressedMatrix`` stores the (L2-normalized) embeddings as float16 or as
+int8 codes with one scale per dimension (scalar quantization), which takes
+2x or 4x less memory than float32. Approximate scores are computed block by
+block so the temporary float32 copy never exceeds ``BLOCK_ROWS`` rows; the
+best candidates are then rescored with the full-precision vectors (see
+``EmbeddingIndex.search``).
+
+``ReducedMatrix`` keeps fewer dimensions per vector, either the leading ones
+(``TruncationReducer``) or a PCA projection (``PCAReducer``), optionally
+compressed as well. If the PCA projection is missing or does not match the
+embeddings, ``build_candidate_tier`` logs a warning and returns no tier, so
+searches fall back to the exact float32 matrix.
+"""
+import logging
+import os
+import zipfile
+
+import numpy as np
+
+PRECISIONS = ('float32', 'float16', 'int8')
+BLOCK_ROWS = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class CompressedMatrix:
+
+    def __init__(self, matrix, precision='int8'):
+        if precision not in PRECISIONS[1:]:
+            raise ValueError(f"Unsupported precision {precision!r}, use one of {PRECISIONS[1:]}")
+        self.precision = precision
+        matrix = np.asarray(matrix)
+        if precision == 'float16':
+            self.scale = None
+            self.codes = np.empty(matrix.shape, dtype=np.float16)
+            for start in range(0, len(matrix), BLOCK_ROWS):
+                self.codes[start:start + BLOCK_ROWS] = matrix[start:start + BLOCK_ROWS]
+        else:
+            # Escala simétrica por dimensión: el valor absoluto máximo se asigna a 127
+            max_abs = np.zeros(matrix.shape[1], dtype=np.float32)
+            for start in range(0, len(matrix), BLOCK_ROWS):
+                np.maximum(max_abs, np.abs(matrix[start:start + BLOCK_ROWS]).max(axis=0), out=max_abs)
+            max_abs[max_abs == 0] = 1.0
+            self.scale = (max_abs / 127).astype(np.float32)
+            self.codes = np.empty(matrix.shape, dtype=np.int8)
+            for start in range(0, len(matrix), BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32) / self.scale
+                self.codes[start:start + BLOCK_ROWS] = np.clip(np.rint(block), -127, 127)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def scores(self, query, rows=None):
+        """Approximate dot products between ``query`` and every row (or only ``rows``)."""
+        codes = self.codes if rows is None else self.codes[rows]
+        query = np.asarray(query, dtype=np.float32)
+        if self.scale is not None:
+            # codes * scale · query == codes · (scale * query)
+            query = query * self.scale
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            block = codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+
+class TruncationReducer:
+    """
+    Keep the first ``dim`` dimensions and renormalize. ``text-embedding-3``
+    models are trained so that their leading dimensions remain a usable
+    embedding on their own.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def transform(self, vectors):
+        vectors = np.asarray(vectors)
+        reduced = np.asarray(vectors[..., :self.dim], dtype=np.float32)
+        norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return reduced / norms
+
+
+class PCAReducer:
+    """Project onto the top ``dim`` principal components (fitted with ``manage.py fit_pca``) and renormalize."""
+
+    def __init__(self, mean, components):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    @property
+    def dim(self):
+        return len(self.components)
+
+    @classmethod
+    def fit(cls, matrix, dim, max_samples=20000, seed=0):
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix if len(matrix) <= max_samples
+                            else matrix[np.sort(rng.choice(len(matrix), max_samples, replace=False))],
+                            dtype=np.float32)
+        mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        return cls(mean, vt[:dim])
+
+    def save(self, path):
+        # Archivo temporal + os.replace: los procesos que cargan la proyección nunca ven un .npz a medias
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, mean=self.mean, components=self.components)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'])
+
+    def transform(self, vectors):
+        reduced = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return reduced / norms
+
+
+class ReducedMatrix:
+    """Candidate tier with fewer dimensions, optionally compressed to float16/int8 as well."""
+
+    def __init__(self, matrix, reducer, precision='float32'):
+        self.reducer = reducer
+        reduced = np.empty((len(matrix), reducer.dim), dtype=np.float32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            reduced[start:start + BLOCK_ROWS] = reducer.transform(matrix[start:start + BLOCK_ROWS])
+        self.matrix = reduced if precision == 'float32' else CompressedMatrix(reduced, precision)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def scores(self, query, rows=None):
+        query = self.reducer.transform(query)
+        if isinstance(self.matrix, CompressedMatrix):
+            return self.matrix.scores(query, rows)
+        return self.matrix @ query if rows is None else self.matrix[rows] @ query
+
+
+def load_pca(path, input_dim, reduced_dim):
+    """
+    The PCA projection fitted by ``fit_pca`` cut to its ``reduced_dim``
+    leading components, or ``None`` (with a warning) if it is missing or was
+    fitted on embeddings of another dimension.
+    """
+    try:
+        reducer = PCAReducer.load(path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        logger.warning("Cannot load the PCA projection %s (%s); using exact float32 search. "
+                       "Run `manage.py fit_pca`.", path, e)
+        return None
+    if reducer.components.shape[1] != input_dim:
+        logger.warning("The PCA projection %s was fitted on %d-dimensional embeddings, the index has %d; "
+                       "using exact float32 search. Run `manage.py fit_pca` again.",
+                       path, reducer.components.shape[1], input_dim)
+        return None
+    if reducer.dim < reduced_dim:
+        logger.warning("The PCA projection %s has %d components, fewer than MOVIE_INDEX_REDUCED_DIM = %d; "
+                       "using %d. Run `manage.py fit_pca --dim %d` to fit more.",
+                       path, reducer.dim, reduced_dim, reducer.dim, reduced_dim)
+    # Las componentes están ordenadas por varianza: las primeras reduced_dim forman la PCA de esa dimensión
+    return PCAReducer(reducer.mean, reducer.components[:reduced_dim])
+
+
+def build_candidate_tier(matrix, precision='float32', reduced_dim=None, reduction='truncate', pca_path=None):
+    """
+    Compressed and/or dimension-reduced copy of ``matrix`` used to find the
+    candidates that are then rescored with the full vectors, or ``None`` when
+    the full float32 matrix should be searched directly.
+    """
+    if reduced_dim and reduced_dim < matrix.shape[1]:
+        if reduction == 'pca':
+            reducer = load_pca(pca_path, matrix.shape[1], reduced_dim)
+            if reducer is None:
+                return None
+        else:
+            reducer = TruncationReducer(reduced_dim)
+        return ReducedMatrix(matrix, reducer, precision)
+    if precision != 'float32':
+        return CompressedMatrix(matrix, precision)
+    return None
@@ -0,0 +1,50 @@
+"""
+Helpers to encode, decode and normalize the vectors stored in ``Movie.emb``.
+
+Embeddings are stored L2-normalized (``Movie.emb_version == NORMALIZED``), so
+the cosine similarity between two stored vectors is just their dot product.
+"""
+import hashlib
+
+import numpy as np
+
+EMBEDDING_DTYPE = np.float32
+
+# Valores de Movie.emb_version
+RAW = 0
+NORMALIZED = 1
+
+
+def normalize(vectors):
+    """L2-normalize a vector or each row of a matrix; zero vectors are left unchanged."""
+    vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """Indices of the ``k`` highest ``scores``, best first (``argpartition`` + sort of ``k`` items)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+def to_blob(vector):
+    """Serialize a vector to the bytes stored in ``Movie.emb``."""
+    return np.ascontiguousarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def from_blob(blob):
+    """Deserialize the bytes stored in ``Movie.emb``."""
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+
+
+def content_hash(text, model):
+    """Hash stored in ``Movie.emb_hash`` to detect descriptions that need a new embedding."""
+    return hashlib.sha256(f'{model}\0{text}'.encode('utf-8')).hexdigest()
@@ -0,0 +1,122 @@
+"""
+SQLite FTS5 full-text index over ``Movie.title``, ``genre`` and
+``description``, used by the search box of the home page.
+
+The virtual table ``movie_movie_fts`` (created by migration
+``0009_movie_fts``) is an external-content index over ``movie_movie``: it
+stores only the tokens, and triggers keep it in sync on every INSERT, UPDATE
+and DELETE, including ``bulk_create``/``bulk_update`` and raw SQL. The
+``unicode61 remove_diacritics 2`` tokenizer makes "schindler" match
+"Schíndler", and every query word is matched as a prefix. Results are
+ordered by (bm25 score, id) and paged with a keyset cursor (the id of the
+last movie of the previous page), so every match is reachable without a cap.
+``manage.py rebuild_fts`` repopulates the index from scratch.
+
+SQLite drops the triggers whenever a migration rebuilds ``movie_movie`` (most
+``AlterField``/``AddField`` operations do), so ``ensure_triggers`` recreates
+them, and rebuilds the index, after every ``migrate`` (see ``signals.py``).
+
+On other database backends ``search`` returns ``None`` and the caller falls
+back to ``icontains``.
+"""
+from django.db import DatabaseError, connection, connections
+
+from .lexical import tokenize
+
+FTS_TABLE = 'movie_movie_fts'
+# Pesos de bm25() por columna: title, genre, description
+COLUMN_WEIGHTS = (10.0, 2.0, 1.0)
+
+TRIGGERS = {
+    'movie_movie_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS movie_movie_fts_ai AFTER INSERT ON movie_movie BEGIN
+            INSERT INTO movie_movie_fts(rowid, title, genre, description)
+            VALUES (new.id, new.title, new.genre, new.description);
+        END
+    """,
+    'movie_movie_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS movie_movie_fts_ad AFTER DELETE ON movie_movie BEGIN
+            INSERT INTO movie_movie_fts(movie_movie_fts, rowid, title, genre, description)
+            VALUES ('delete', old.id, old.title, old.genre, old.description);
+        END
+    """,
+    'movie_movie_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS movie_movie_fts_au AFTER UPDATE OF title, genre, description ON movie_movie BEGIN
+            INSERT INTO movie_movie_fts(movie_movie_fts, rowid, title, genre, description)
+            VALUES ('delete', old.id, old.title, old.genre, old.description);
+            INSERT INTO movie_movie_fts(rowid, title, genre, description)
+            VALUES (new.id, new.title, new.genre, new.description);
+        END
+    """,
+}
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(term):
+    """``'La lista de Schín'`` -> ``'"la"* "lista"* "de"* "schin"*'`` (every word, as a prefix)."""
+    return ' '.join(f'"{token}"*' for token in tokenize(term))
+
+
+def search(term, limit, after=None):
+    """
+    Up to ``limit`` ids of the movies matching every word of ``term``, best
+    first (bm25 ranking, ties by id), starting after the movie ``after``; or
+    ``None`` when full-text search cannot be used.
+    """
+    if not available():
+        return None
+    expression = match_expression(term)
+    if not expression:
+        return None
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    # Paginación por cursor sobre (puntuación, id): la película `after` da la posición de inicio
+    sql = (
+        f'WITH ranked AS (SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s) '
+        f'SELECT id FROM ranked '
+    )
+    params = [expression]
+    if after is not None:
+        sql += 'WHERE (score, id) > (SELECT score, id FROM ranked WHERE id = %s) '
+        params.append(after)
+    sql += 'ORDER BY score, id LIMIT %s'
+    params.append(limit)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        # Tabla sin crear (migración pendiente) o SQLite sin FTS5
+        return None
+
+
+def rebuild():
+    """Repopulate the whole index from ``movie_movie`` and merge its segments."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def ensure_triggers(using='default'):
+    """
+    Recreate the sync triggers if a table rebuild dropped them, then rebuild
+    the index (rows written meanwhile were not indexed). Returns the names of
+    the recreated triggers.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return []
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name, type FROM sqlite_master WHERE name = %s OR type = 'trigger'", [FTS_TABLE])
+        existing = {name for name, _ in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return []  # migración 0009 pendiente
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return missing
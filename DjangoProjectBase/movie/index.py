@@ -0,0 +1,307 @@
+"""
+In-memory embedding index used by the recommendation views.
+
+Every stored ``Movie.emb`` blob is decoded once into a single contiguous
+float32 matrix (one row per movie) together with an array holding the
+matching movie ids. A query is then one matrix-vector product followed by an
+``argpartition`` top-k, instead of an ORM query and a Python loop per request.
+
+Rows are L2-normalized (see ``embeddings.py``), so cosine similarity is a
+plain dot product. The index lives for the whole process and is rebuilt
+lazily the next time it is queried after a ``Movie`` has been saved or
+deleted in this process (see ``signals.py``), or when the catalog fingerprint
+changes because another process or a bulk write changed the movies (see
+``catalog.py``). With ``settings.MOVIE_EMBEDDING_SOURCE ==
+'store'`` the matrix is instead memory-mapped from the shared file written by
+``manage.py export_embeddings`` (see ``store.py``). With the PCA candidate
+tier the index is also rebuilt when ``manage.py fit_pca`` replaces the
+projection file.
+"""
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from . import catalog, store
+from .compression import build_candidate_tier
+from .embeddings import NORMALIZED, from_blob, normalize, top_k
+
+
+def load_from_database(backend=None):
+    """
+    Decode the stored ``Movie.emb`` vectors produced by ``backend`` (default:
+    the active provider's key, see ``providers.py``) into ``(ids, matrix)``
+    with L2-normalized rows.
+    """
+    from .models import Movie
+    from .providers import get_provider
+
+    ids = []
+    vectors = []
+    normalized = []
+    rows = (Movie.objects.filter(emb_backend=backend or get_provider().key)
+            .values_list('id', 'emb', 'emb_version').iterator())
+    for movie_id, emb, emb_version in rows:
+        if emb:
+            ids.append(movie_id)
+            vectors.append(from_blob(emb))
+            normalized.append(emb_version >= NORMALIZED)
+
+    if not vectors:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    # Solo se indexan los vectores con la dimensión más común: los
+    # embeddings por defecto del modelo tienen otro tamaño.
+    dim = Counter(len(v) for v in vectors).most_common(1)[0][0]
+    keep = [i for i, v in enumerate(vectors) if len(v) == dim]
+
+    matrix = np.empty((len(keep), dim), dtype=np.float32)
+    for row, i in enumerate(keep):
+        matrix[row] = vectors[i] if normalized[i] else normalize(vectors[i])
+    movie_ids = np.array([ids[i] for i in keep], dtype=np.int64)
+    return movie_ids, matrix
+
+
+class FilterMasks:
+    """
+    Per-row metadata aligned with the index matrix, used to restrict a search
+    to the eligible movies with NumPy boolean masks instead of an ORM query.
+    """
+
+    def __init__(self, ids):
+        from .models import Movie
+
+        self.years = np.full(len(ids), -1, dtype=np.int32)
+        self.genres = {}
+        row_of = {int(movie_id): row for row, movie_id in enumerate(ids)}
+        for movie_id, year in Movie.objects.filter(year__isnull=False).values_list('id', 'year').iterator():
+            row = row_of.get(movie_id)
+            if row is not None:
+                self.years[row] = year
+        # Relación Movie.genres (tabla intermedia indexada), sin separar cadenas en Python
+        links = Movie.genres.through.objects.values_list('movie_id', 'genre__name').iterator()
+        for movie_id, name in links:
+            row = row_of.get(movie_id)
+            if row is None:
+                continue
+            name = name.lower()
+            if name not in self.genres:
+                self.genres[name] = np.zeros(len(ids), dtype=bool)
+            self.genres[name][row] = True
+
+    def genre_names(self):
+        return sorted(self.genres)
+
+    def mask(self, genre=None, year_min=None, year_max=None):
+        """Boolean mask of the eligible rows, or ``None`` when no filter applies."""
+        mask = None
+        if genre:
+            mask = self.genres.get(genre.strip().lower(), np.zeros(len(self.years), dtype=bool)).copy()
+        if year_min is not None:
+            mask = self.years >= year_min if mask is None else mask & (self.years >= year_min)
+        if year_max is not None:
+            in_range = (self.years >= 0) & (self.years <= year_max)
+            mask = in_range if mask is None else mask & in_range
+        return mask
+
+
+def split_genres(genre):
+    """``'Drama, Crime'`` -> ``['drama', 'crime']``"""
+    return [name.strip().lower() for name in (genre or '').split(',') if name.strip()]
+
+
+class EmbeddingIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._generation = 0
+        self._built_generation = -1
+        self._store_version = None
+        self._catalog_version = None
+        self._pca_version = None
+
+    def invalidate(self):
+        """Mark the index as stale; it is rebuilt on the next query."""
+        self._generation += 1
+
+    def _uses_store(self):
+        return settings.MOVIE_EMBEDDING_SOURCE == 'store'
+
+    def _pca_mtime(self):
+        # Solo importa si el nivel de candidatos usa la proyección PCA
+        if not settings.MOVIE_INDEX_REDUCED_DIM or settings.MOVIE_INDEX_REDUCTION != 'pca':
+            return None
+        try:
+            return os.stat(settings.MOVIE_PCA_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _build(self):
+        data = store.open_store() if self._uses_store() else None
+        ids, matrix = data if data is not None else load_from_database()
+        tier = None
+        if len(ids):
+            tier = build_candidate_tier(
+                matrix,
+                precision=settings.MOVIE_INDEX_PRECISION,
+                reduced_dim=settings.MOVIE_INDEX_REDUCED_DIM,
+                reduction=settings.MOVIE_INDEX_REDUCTION,
+                pca_path=settings.MOVIE_PCA_PATH,
+            )
+        return IndexData(ids, matrix, FilterMasks(ids), tier)
+
+    def _load(self):
+        # Con MOVIE_EMBEDDING_SOURCE = 'store' el índice sigue al archivo exportado
+        store_version = store.manifest_mtime() if self._uses_store() else None
+        # Cambios hechos por otros procesos o con bulk_update (sin post_save en este proceso)
+        catalog_version = catalog.current_version()
+        pca_version = self._pca_mtime()
+        with self._lock:
+            if (self._data is None or self._built_generation != self._generation
+                    or store_version != self._store_version or catalog_version != self._catalog_version
+                    or pca_version != self._pca_version):
+                generation = self._generation
+                self._data = self._build()
+                self._built_generation = generation
+                self._store_version = store_version
+                self._catalog_version = catalog_version
+                self._pca_version = pca_version
+            return self._data
+
+    def data(self):
+        """The current ``IndexData``, rebuilt first if needed (this is the only step that queries the database)."""
+        return self._load()
+
+    def snapshot(self):
+        """Return the current ``(ids, matrix)`` arrays, rebuilding them if needed."""
+        data = self._load()
+        return data.ids, data.matrix
+
+    def filters(self):
+        return self._load().filters
+
+    def __len__(self):
+        return len(self._load().ids)
+
+    def similarities(self, query, movie_ids):
+        return self._load().similarities(query, movie_ids)
+
+    def search(self, query, k=1, genre=None, year_min=None, year_max=None, min_score=None):
+        return self._load().search(query, k=k, genre=genre, year_min=year_min, year_max=year_max,
+                                   min_score=min_score)
+
+
+class IndexData:
+    """
+    One build of ``EmbeddingIndex``: the ids, the matrix, the filter masks and
+    the optional candidate tier. Searching it only runs NumPy, never a
+    database query, so it can run in any thread.
+    """
+
+    def __init__(self, ids, matrix, filters, tier=None):
+        self.ids = ids
+        self.matrix = matrix
+        self.filters = filters
+        self.tier = tier
+
+    def similarities(self, query, movie_ids):
+        """``{movie_id: cosine similarity to query}`` for the given movies that have an indexed embedding."""
+        ids, matrix = self.ids, self.matrix
+        if not len(ids) or not movie_ids:
+            return {}
+        query = normalize(query)
+        if query.shape[0] != matrix.shape[1]:
+            raise ValueError(
+                f"Query embedding has {query.shape[0]} dimensions, index has {matrix.shape[1]}"
+            )
+        rows = np.flatnonzero(np.isin(ids, np.asarray(movie_ids, dtype=np.int64)))
+        scores = matrix[rows] @ query
+        return {int(ids[row]): float(score) for row, score in zip(rows, scores)}
+
+    def search(self, query, k=1, genre=None, year_min=None, year_max=None, min_score=None):
+        """
+        Return up to ``k`` ``(movie_id, similarity)`` pairs sorted by cosine
+        similarity to ``query``, best first.
+
+        ``genre``, ``year_min`` and ``year_max`` restrict the search to the
+        matching rows (similarity is only computed for those), and results
+        below ``min_score`` are dropped.
+        """
+        ids, matrix = self.ids, self.matrix
+        if not len(ids):
+            return []
+
+        query = normalize(query)
+        if query.shape[0] != matrix.shape[1]:
+            raise ValueError(
+                f"Query embedding has {query.shape[0]} dimensions, index has {matrix.shape[1]}"
+            )
+
+        mask = self.filters.mask(genre=genre, year_min=year_min, year_max=year_max)
+        rows = None if mask is None else np.flatnonzero(mask)
+        positions, scores = tiered_search(matrix, query, k, tier=self.tier, rows=rows,
+                                          rescore_factor=settings.MOVIE_INDEX_RESCORE_FACTOR)
+        if min_score is not None:
+            keep = scores >= min_score
+            positions, scores = positions[keep], scores[keep]
+        return [(int(ids[i]), float(score)) for i, score in zip(positions, scores)]
+
+
+def tiered_search(matrix, query, k, tier=None, rows=None, rescore_factor=10):
+    """
+    Top-k rows of ``matrix`` by dot product with the normalized ``query``,
+    returned as ``(positions, scores)``, best first.
+
+    Only ``rows`` are considered when given. With a candidate ``tier`` (see
+    ``compression.build_candidate_tier``) the ``k * rescore_factor`` best
+    approximate candidates are rescored with the full-precision rows of
+    ``matrix``, so the returned scores are exact.
+    """
+    if tier is None:
+        # Las filas están normalizadas: la similitud de coseno es un producto punto
+        scores = matrix @ query if rows is None else matrix[rows] @ query
+        top = top_k(scores, k)
+        positions = top if rows is None else rows[top]
+        return positions, scores[top]
+
+    candidates = top_k(tier.scores(query, rows), k * max(rescore_factor, 1))
+    if rows is not None:
+        candidates = rows[candidates]
+    candidates = np.sort(candidates)  # lectura secuencial del memmap
+    exact = matrix[candidates] @ query
+    top = top_k(exact, k)
+    return candidates[top], exact[top]
+
+
+embedding_index = EmbeddingIndex()
+
+
+def get_search_index():
+    """Index backing the recommendation views, chosen by ``settings.MOVIE_SEARCH_BACKEND``."""
+    if settings.MOVIE_SEARCH_BACKEND == 'ivf':
+        from .ann import ann_index
+        return ann_index
+    return embedding_index
+
+
+def search_movies(query, k=1, genre=None, year_min=None, year_max=None, min_score=None, data=None):
+    """
+    Top-k ``(movie_id, similarity)`` pairs for ``query``. Filtered queries
+    always use the exact index, which only scores the eligible rows. With
+    ``data`` (an ``IndexData``) the exact searches use it instead of
+    ``embedding_index``.
+    """
+    exact = data if data is not None else embedding_index
+    if genre or year_min is not None or year_max is not None:
+        return exact.search(query, k=k, genre=genre, year_min=year_min, year_max=year_max, min_score=min_score)
+    index = get_search_index()
+    if index is embedding_index:
+        results = exact.search(query, k=k)
+    else:
+        results = index.search(query, k=k, fallback=exact)
+    if min_score is not None:
+        results = [(movie_id, score) for movie_id, score in results if score >= min_score]
+    return results
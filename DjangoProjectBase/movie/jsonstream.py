@@ -0,0 +1,76 @@
+"""
+Incremental parsing of large JSON arrays (``[{...}, {...}, ...]``).
+
+``iter_json_array`` reads the file in fixed-size chunks and decodes one
+element at a time with ``json.JSONDecoder.raw_decode``, so memory use depends
+on the size of the largest element, not on the size of the file.
+"""
+import json
+
+CHUNK_SIZE = 1 << 16
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Yield the elements of the JSON array read from the text ``file`` object."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip():
+        # Salta espacios; lee más datos si el búfer se acaba. Devuelve el siguiente carácter ('' al final)
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position] if position < len(buffer) else ''
+            fill()
+
+    if skip() != '[':
+        raise ValueError("Expected a JSON array")
+    position += 1
+
+    char = skip()
+    while char != ']':
+        # Exactamente una coma entre elementos: "[,1]", "[1,,2]" y "[1,]" no son válidos
+        if not char:
+            raise ValueError("Unterminated JSON array")
+        if char == ',':
+            raise ValueError("Expected an array element, found ','")
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Elemento incompleto: se necesita más texto
+                if eof:
+                    raise
+                fill()
+                continue
+            # El elemento termina en ',' o ']': sin ver el separador, un número puede estar
+            # cortado en el límite del bloque ("1" de "1.5", "12" de "123")
+            following = end
+            while following < len(buffer) and buffer[following].isspace():
+                following += 1
+            if following < len(buffer) and buffer[following] in ',]':
+                break
+            if eof:
+                raise ValueError("Expected ',' or ']' after an array element")
+            fill()
+        position = end
+        yield item
+        if skip() == ',':
+            position += 1
+            char = skip()
+            if char == ']':
+                raise ValueError("Expected an array element, found ']'")
+        else:
+            char = ']'
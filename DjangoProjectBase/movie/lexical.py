@@ -0,0 +1,166 @@
+"""
+In-memory inverted index with BM25 scoring over ``title``, ``description``
+and ``genre``.
+
+Embedding similarity is poor at exact keywords (names, places, "Rosebud"),
+so the recommendation view fuses the BM25 ranking with the vector ranking
+using reciprocal-rank fusion (``reciprocal_rank_fusion``). Text is
+lowercased and stripped of accents before tokenizing, so "Amélie" matches
+"amelie". The index is built lazily from the ``Movie`` table on the first
+query and then kept up to date by the ``post_save``/``post_delete`` signals
+(see ``signals.py``). Changes that send no signal to this process (bulk
+writes, other workers) are picked up by reloading the index when the catalog
+fingerprint changes (see ``catalog.py``). The fingerprint is only checked
+when the index is read (at most every ``MOVIE_CATALOG_CHECK_INTERVAL``
+seconds); saving a movie runs no extra query.
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from . import catalog
+from .index import split_genres
+
+TOKEN_RE = re.compile(r'\w+')
+# Las palabras del título cuentan más que las de la descripción
+TITLE_WEIGHT = 3
+GENRE_WEIGHT = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """``'Amélie, the Movie'`` -> ``['amelie', 'the', 'movie']``"""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text)
+
+
+def document_terms(title, description, genre):
+    terms = Counter(tokenize(description))
+    for term in tokenize(title):
+        terms[term] += TITLE_WEIGHT
+    for term in tokenize(genre):
+        terms[term] += GENRE_WEIGHT
+    return terms
+
+
+class LexicalIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None  # huella del catálogo con la que se cargó (catalog.version)
+        self._postings = {}   # term -> {movie_id: term frequency}
+        self._docs = {}       # movie_id -> Counter of terms
+        self._lengths = {}    # movie_id -> document length
+        self._meta = {}       # movie_id -> (year, genres) para los filtros
+        self._total_length = 0
+
+    def _add(self, movie_id, title, description, genre, year):
+        terms = document_terms(title, description, genre)
+        self._docs[movie_id] = terms
+        length = sum(terms.values())
+        self._lengths[movie_id] = length
+        self._total_length += length
+        self._meta[movie_id] = (year, set(split_genres(genre)))
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[movie_id] = tf
+
+    def _remove(self, movie_id):
+        terms = self._docs.pop(movie_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(movie_id)
+        self._meta.pop(movie_id, None)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[movie_id]
+            if not postings:
+                del self._postings[term]
+
+    def _ensure_loaded(self):
+        from .models import Movie
+
+        version = catalog.current_version()
+        if self._loaded and version == self._version:
+            return
+        self._postings, self._docs, self._lengths, self._meta = {}, {}, {}, {}
+        self._total_length = 0
+        rows = Movie.objects.values_list('id', 'title', 'description', 'genre', 'year').iterator()
+        for movie_id, title, description, genre, year in rows:
+            self._add(movie_id, title, description, genre, year)
+        self._loaded = True
+        self._version = version
+
+    def upsert(self, movie):
+        """Reindex a saved ``Movie``; a no-op until the index has been loaded."""
+        with self._lock:
+            if self._loaded:
+                self._remove(movie.id)
+                # La huella sigue siendo la de la carga: si otro proceso cambió el catálogo
+                # antes, la siguiente lectura recarga el índice igualmente
+                self._add(movie.id, movie.title, movie.description, movie.genre, movie.year)
+
+    def remove(self, movie_id):
+        with self._lock:
+            if self._loaded:
+                self._remove(movie_id)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._docs)
+
+    def search(self, text, k=10, genre=None, year_min=None, year_max=None):
+        """
+        Return up to ``k`` ``(movie_id, bm25_score)`` pairs for the words of
+        ``text``, best first, restricted to the movies matching the filters.
+        """
+        query_terms = set(tokenize(text))
+        genre = genre.strip().lower() if genre else None
+        with self._lock:
+            self._ensure_loaded()
+            n = len(self._docs)
+            if not n or not query_terms:
+                return []
+            avg_length = self._total_length / n
+            scores = Counter()
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for movie_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[movie_id] / avg_length)
+                    scores[movie_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            if genre or year_min is not None or year_max is not None:
+                for movie_id in list(scores):
+                    year, genres = self._meta[movie_id]
+                    if ((genre and genre not in genres)
+                            or (year_min is not None and (year is None or year < year_min))
+                            or (year_max is not None and (year is None or year > year_max))):
+                        del scores[movie_id]
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several rankings (lists of ``(movie_id, score)``, best first) into
+    one list of ``(movie_id, fused_score)``. Each list contributes
+    ``1 / (k + rank)`` per movie, so only positions matter, not the scales
+    of the original scores.
+    """
+    fused = Counter()
+    for ranking in rankings:
+        for rank, (movie_id, _) in enumerate(ranking, start=1):
+            fused[movie_id] += 1 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+lexical_index = LexicalIndex()
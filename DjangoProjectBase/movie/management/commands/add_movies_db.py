@@ -1,31 +1,81 @@
 from django.core.management.base import BaseCommand
-from movie.models import Movie
+from django.db import reset_queries, transaction
+from movie import catalog
+from movie.jsonstream import iter_json_array
+from movie.models import Movie, first_genre_of, sync_genres
 import os
-import json
 
 class Command(BaseCommand):
-    help = 'Load movies from movie_descriptions.json into the Movie model'
+    help = 'Load movies from movies.json into the Movie model (streaming, in batches)'
 
-    def handle(self, *args, **kwargs):
-        # Construct the full path to the JSON file
+    def add_arguments(self, parser):
         #Recuerde que la consola está ubicada en la carpeta DjangoProjectBase.
-        #El path del archivo movie_descriptions con respecto a DjangoProjectBase sería la carpeta anterior
-        json_file_path = 'movie/management/commands/movies.json' 
-        
-        # Load data from the JSON file
-        with open(json_file_path, 'r') as file:
-            movies = json.load(file)
-        
-        # Add products to the database
-        for i in range(100):
-            movie = movies[i]
-            exist = Movie.objects.filter(title = movie['title']).first() #Se asegura que la película no exista en la base de datos
-            if not exist:              
-                Movie.objects.create(title = movie['title'],
-                                     image = 'movie/images/default.jpg',
-                                     genre = movie['genre'],
-                                     year = movie['year'])        
-        
-        #self.stdout.write(self.style.SUCCESS(f'Successfully added {cont} products to the database'))
-                
-                
\ No newline at end of file
+        parser.add_argument('--file', type=str, default='movie/management/commands/movies.json',
+                            help='JSON file with an array of movies (title, genre, year and optional description)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Movies checked and inserted per transaction')
+        parser.add_argument('--limit', type=int, help='Import at most this many movies from the file')
+
+    def handle(self, *args, **options):
+        json_file_path = options['file']
+        batch_size = max(1, options['batch_size'])
+        limit = options['limit']
+
+        # ✅ Verifica si el archivo existe
+        if not os.path.exists(json_file_path):
+            self.stderr.write(f"JSON file '{json_file_path}' not found.")
+            return
+
+        total = 0
+        created_count = 0
+        skipped_count = 0
+        error_count = 0
+        batch = {}
+
+        def flush():
+            # Una consulta por lote (title__in usa el índice de title) en lugar de una por película
+            nonlocal created_count, skipped_count
+            with transaction.atomic():
+                existing = set(Movie.objects.filter(title__in=list(batch)).values_list('title', flat=True))
+                new_movies = [movie for title, movie in batch.items() if title not in existing]
+                created = Movie.objects.bulk_create(new_movies)
+                sync_genres(created)
+            created_count += len(created)
+            skipped_count += len(existing)
+            batch.clear()
+            reset_queries()  #Con DEBUG=True Django guarda cada consulta SQL (y cada lote ocupa cientos de KB)
+
+        # 📖 El archivo se lee de forma incremental: la memoria no depende de su tamaño
+        with open(json_file_path, 'r', encoding='utf-8') as file:
+            for movie in iter_json_array(file):
+                if limit is not None and total >= limit:
+                    break
+                total += 1
+                try:
+                    title = movie['title']
+                    genre = movie.get('genre') or ''
+                    batch_movie = Movie(title=title,
+                                        description=movie.get('description') or '',
+                                        image='movie/images/default.jpg',
+                                        genre=genre,
+                                        first_genre=first_genre_of(genre),
+                                        year=movie.get('year'))
+                except (KeyError, TypeError, AttributeError) as e:
+                    error_count += 1
+                    self.stderr.write(self.style.ERROR(f"Error processing movie {total}: {e!r}"))
+                    continue
+
+                if title in batch:
+                    skipped_count += 1  #Título repetido en el archivo: se conserva el primero
+                    continue
+                batch[title] = batch_movie
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+        # ✅ bulk_create no envía señales: los servidores en marcha recargan sus índices
+        if created_count:
+            catalog.touch()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully added {created_count} movies to the database '
+            f'({skipped_count} already present, {error_count} errors, {total} read)'))
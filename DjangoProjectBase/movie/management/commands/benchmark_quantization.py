@@ -0,0 +1,75 @@
+import json
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from movie.benchmarks import recall_at_k, sample_queries, synthetic_embeddings, time_queries
+from movie.compression import PRECISIONS, CompressedMatrix, PCAReducer, ReducedMatrix, TruncationReducer
+from movie.index import load_from_database, tiered_search
+
+class Command(BaseCommand):
+    help = "Compare recall@k, latency and memory of the float32, float16, int8 and reduced-dimension search tiers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='k used for recall@k')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+        parser.add_argument('--rescore-factor', type=int, default=settings.MOVIE_INDEX_RESCORE_FACTOR,
+                            help='Candidates rescored in float32 = k * rescore factor')
+        parser.add_argument('--synthetic', type=int, help='Use N synthetic embeddings instead of the database')
+        parser.add_argument('--dim', type=int, default=1536, help='Dimensions of the synthetic embeddings')
+        parser.add_argument('--reduced-dim', type=int, help='Also benchmark truncated and PCA tiers with this many dimensions')
+        parser.add_argument('--json', type=str, help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        # ✅ Load the catalog (or generate a synthetic one)
+        if options['synthetic']:
+            matrix = synthetic_embeddings(options['synthetic'], options['dim'])
+        else:
+            _, matrix = load_from_database()
+        if not len(matrix):
+            self.stderr.write("❌ No embeddings to benchmark")
+            return
+        k = min(options['k'], len(matrix))
+        queries = sample_queries(matrix, options['queries'])
+        self.stdout.write(f"Benchmarking {len(matrix)} x {matrix.shape[1]} embeddings with {len(queries)} queries")
+
+        # ✅ Candidate tiers to compare (None = exact float32 search)
+        tiers = [(precision, None if precision == 'float32' else CompressedMatrix(matrix, precision))
+                 for precision in PRECISIONS]
+        reduced_dim = options['reduced_dim']
+        if reduced_dim and reduced_dim < matrix.shape[1]:
+            for name, reducer in (('truncate', TruncationReducer(reduced_dim)),
+                                  ('pca', PCAReducer.fit(matrix, reduced_dim))):
+                for precision in ('float32', 'int8'):
+                    tiers.append((f'{name}{reducer.dim}-{precision}', ReducedMatrix(matrix, reducer, precision)))
+
+        exact_positions = None
+        results = []
+        for precision, tier in tiers:
+            found, latencies = time_queries(
+                lambda q: tiered_search(matrix, q, k, tier=tier, rescore_factor=options['rescore_factor'])[0],
+                queries,
+            )
+            if exact_positions is None:
+                exact_positions = found
+            recall = np.mean([recall_at_k(e, f) for e, f in zip(exact_positions, found)])
+            results.append({
+                'precision': precision,
+                'index_bytes': int(matrix.nbytes if tier is None else tier.nbytes),
+                f'recall@{k}': float(recall),
+                'mean_ms': float(1000 * latencies.mean()),
+                'p95_ms': float(1000 * np.percentile(latencies, 95)),
+            })
+
+        # ✅ Print the comparison table
+        self.stdout.write(f"\n{'tier':<20}{'index MB':>10}{f'recall@{k}':>12}{'mean ms':>10}{'p95 ms':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['precision']:<20}{row['index_bytes'] / 2**20:>10.2f}{row[f'recall@{k}']:>12.3f}"
+                f"{row['mean_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'rows': len(matrix), 'dim': int(matrix.shape[1]), 'k': k,
+                           'rescore_factor': options['rescore_factor'], 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Results written to {options['json']}"))
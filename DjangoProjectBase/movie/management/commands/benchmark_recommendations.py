@@ -0,0 +1,219 @@
+import contextlib
+import gc
+import io
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from movie.ann import IVFIndex
+from movie.benchmarks import (latency_summary, legacy_orm_search, recall_at_k, sample_queries, synthetic_embeddings,
+                              time_queries, traced_peak_mb)
+from movie.compression import CompressedMatrix
+from movie.embeddings import NORMALIZED, to_blob
+from movie.index import embedding_index, tiered_search
+from movie.models import Movie
+from movie.providers import get_provider
+
+class Command(BaseCommand):
+    help = ("Benchmark the recommendation search paths on synthetic catalogs (OpenAI is stubbed out) and "
+            "write p50/p95/p99 latency, throughput, peak memory per path and recall@k to JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='1000,100000,1000000',
+                            help='Comma-separated catalog sizes (1M x 1536 float32 needs ~6 GB per copy)')
+        parser.add_argument('--dim', type=int, default=1536, help='Embedding dimensions')
+        parser.add_argument('--queries', type=int, default=200, help='Queries per in-memory path')
+        parser.add_argument('--k', type=int, default=10, help='k used for recall@k')
+        parser.add_argument('--db-max-rows', type=int, default=20000,
+                            help='Largest catalog loaded into a test database for the ORM loop and the view')
+        parser.add_argument('--orm-queries', type=int, default=20, help='Queries for the (slow) per-row ORM loop')
+        parser.add_argument('--memory-queries', type=int, default=5,
+                            help='Queries re-run under tracemalloc to measure the query-time peak memory of each path')
+        parser.add_argument('--nprobe', type=int, default=settings.MOVIE_ANN_NPROBE, help='Cells scanned by the IVF path')
+        parser.add_argument('--json', type=str, help='Output file (default: DATA_DIR/benchmarks/recommendations-<timestamp>.json)')
+        parser.add_argument('--baseline', type=str, help='Previous JSON results to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p95 slowdown versus the baseline before reporting a regression')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        self.results = []
+
+        for n in sizes:
+            # ✅ Synthetic catalog and queries (stand-ins for the OpenAI prompt embeddings)
+            self.stdout.write(f"\nCatalog of {n} movies x {options['dim']} dimensions")
+            matrix = synthetic_embeddings(n, options['dim'])
+            queries = sample_queries(matrix, options['queries'])
+            ids = np.arange(1, n + 1)
+
+            memory_queries = queries[:options['memory_queries']]
+
+            # ✅ Exact search over the in-memory matrix (reference for recall)
+            exact_search = lambda q: tiered_search(matrix, q, k)[0]
+            found, latencies = time_queries(exact_search, queries)
+            exact = [ids[positions].tolist() for positions in found]
+            self._record(n, 'index-exact', exact, latencies, exact, index_bytes=matrix.nbytes,
+                         query_peak_mb=self._query_peak(exact_search, memory_queries))
+
+            # ✅ int8 candidate tier + float32 rescoring
+            # (las construcciones son operaciones NumPy: el coste de tracemalloc es despreciable)
+            start = time.perf_counter()
+            tier, build_peak = traced_peak_mb(lambda: CompressedMatrix(matrix, 'int8'))
+            build_s = time.perf_counter() - start
+            int8_search = lambda q: tiered_search(matrix, q, k, tier=tier,
+                                                  rescore_factor=settings.MOVIE_INDEX_RESCORE_FACTOR)[0]
+            found, latencies = time_queries(int8_search, queries)
+            self._record(n, 'index-int8', [ids[p].tolist() for p in found], latencies, exact,
+                         build_s=build_s, index_bytes=tier.nbytes, build_peak_mb=build_peak,
+                         query_peak_mb=self._query_peak(int8_search, memory_queries))
+            del tier
+
+            # ✅ IVF approximate index
+            start = time.perf_counter()
+            ivf, build_peak = traced_peak_mb(lambda: IVFIndex.build(
+                ids, matrix, nlist=max(1, min(4 * int(np.sqrt(n)), n // 39)), nprobe=options['nprobe']))
+            build_s = time.perf_counter() - start
+            ivf_search = lambda q: [i for i, _ in ivf.search(q, k=k)]
+            found, latencies = time_queries(ivf_search, queries)
+            self._record(n, 'index-ivf', found, latencies, exact, build_s=build_s,
+                         index_bytes=ivf.vectors.nbytes + ivf.centroids.nbytes, build_peak_mb=build_peak,
+                         query_peak_mb=self._query_peak(ivf_search, memory_queries))
+            del ivf
+
+            # ✅ Paths that read from the database: the original per-row loop and the view itself
+            if n <= options['db_max_rows']:
+                self._database_paths(n, matrix, queries, exact, options)
+            else:
+                self.stdout.write(f"  skipping the ORM loop and the view (more than --db-max-rows={options['db_max_rows']})")
+
+            del matrix, queries
+            gc.collect()
+
+        # ✅ Write the results
+        path = options['json'] or str(settings.DATA_DIR / 'benchmarks' /
+                                      f"recommendations-{datetime.now():%Y%m%d-%H%M%S}.json")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'numpy': np.__version__,
+                'dim': options['dim'],
+                'k': k,
+                'results': self.results,
+            }, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"✅ Results written to {path}"))
+
+        if options['baseline']:
+            self._compare(options['baseline'], k, options['tolerance'])
+
+    @staticmethod
+    def _query_peak(search, queries):
+        # Pasada aparte bajo tracemalloc, para no alterar las latencias medidas
+        return traced_peak_mb(lambda: [search(query) for query in queries])[1]
+
+    def _record(self, n, path, found, latencies, exact, build_s=0.0, index_bytes=None,
+                build_peak_mb=None, query_peak_mb=None):
+        row = {
+            'rows': n,
+            'path': path,
+            'queries': len(latencies),
+            **latency_summary(latencies),
+            'recall_at_k': float(np.mean([recall_at_k(e, f) for e, f in zip(exact, found)])),
+            'build_s': float(build_s),
+            'index_mb': None if index_bytes is None else index_bytes / 2**20,
+            # Memoria asignada por esta ruta (tracemalloc), no el máximo acumulado del proceso
+            'build_peak_mb': build_peak_mb,
+            'query_peak_mb': query_peak_mb,
+        }
+        self.results.append(row)
+        self.stdout.write(
+            f"  {path:<12} p50 {row['p50_ms']:9.3f} ms  p95 {row['p95_ms']:9.3f} ms  p99 {row['p99_ms']:9.3f} ms"
+            f"  {row['qps']:9.1f} q/s  recall {row['recall_at_k']:.3f}"
+            + (f"  build mem {build_peak_mb:.1f} MB" if build_peak_mb is not None else '')
+            + (f"  query mem {query_peak_mb:.1f} MB" if query_peak_mb is not None else '')
+        )
+
+    def _database_paths(self, n, matrix, queries, exact_ids, options):
+        k = options['k']
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Filas sintéticas en una base de datos de prueba (la real no se toca)
+            key = get_provider().key
+            for start in range(0, n, 1000):
+                Movie.objects.bulk_create([
+                    Movie(title=f'Synthetic movie {start + i}', description='', emb=to_blob(row),
+                          emb_version=NORMALIZED, emb_backend=key)
+                    for i, row in enumerate(matrix[start:start + 1000])
+                ])
+            db_ids = np.array(Movie.objects.order_by('id').values_list('id', flat=True))
+            # Las filas se insertaron en orden: el id sintético i corresponde a db_ids[i - 1]
+            exact = [db_ids[np.array(found) - 1].tolist() for found in exact_ids]
+
+            # ✅ Original per-row ORM loop
+            orm_queries = queries[:options['orm_queries']]
+            orm_search = lambda q: legacy_orm_search(q, k)
+            found, latencies = time_queries(orm_search, orm_queries)
+            self._record(n, 'orm-loop', found, latencies, exact,
+                         query_peak_mb=self._query_peak(orm_search, orm_queries[:options['memory_queries']]))
+
+            # ✅ recommendations_view end to end, with the prompt embedding stubbed out
+            # Prompts sin dígitos, para que la búsqueda BM25 no coincida con los títulos sintéticos
+            prompts = {'benchmark prompt ' + str(i).translate(str.maketrans('0123456789', 'abcdefghij')): query
+                       for i, query in enumerate(queries)}
+            client = Client()
+            with override_settings(MOVIE_EMBEDDING_SOURCE='database', MOVIE_SEARCH_BACKEND='exact',
+                                   ALLOWED_HOSTS=['testserver']), \
+                    mock.patch('movie.views.get_prompt_embedding', side_effect=prompts.__getitem__), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                embedding_index.invalidate()
+                # La primera petición construye el índice en memoria
+                start = time.perf_counter()
+                client.get('/recommendations/', {'prompt': next(iter(prompts)), 'k': k})
+                build_s = time.perf_counter() - start
+
+                def view_search(prompt):
+                    response = client.get('/recommendations/', {'prompt': prompt, 'k': k})
+                    return [movie.id for movie in response.context['movies']]
+
+                found, latencies = time_queries(view_search, list(prompts))
+                query_peak = self._query_peak(view_search, list(prompts)[:options['memory_queries']])
+
+                # Memoria de la construcción del índice: se repite la primera petición bajo tracemalloc
+                embedding_index.invalidate()
+                _, build_peak = traced_peak_mb(lambda: view_search(next(iter(prompts))))
+            self._record(n, 'view', found, latencies, exact, build_s=build_s,
+                         build_peak_mb=build_peak, query_peak_mb=query_peak)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            embedding_index.invalidate()
+
+    def _compare(self, baseline_path, k, tolerance):
+        with open(baseline_path) as f:
+            baseline = {(row['rows'], row['path']): row for row in json.load(f)['results']}
+        regressions = []
+        for row in self.results:
+            before = baseline.get((row['rows'], row['path']))
+            if before is None:
+                continue
+            slowdown = row['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+            if slowdown > 1 + tolerance:
+                regressions.append(f"{row['path']} @ {row['rows']}: p95 {before['p95_ms']:.3f} -> {row['p95_ms']:.3f} ms")
+            if row['recall_at_k'] < before['recall_at_k'] - 0.01:
+                regressions.append(f"{row['path']} @ {row['rows']}: recall@{k} "
+                                   f"{before['recall_at_k']:.3f} -> {row['recall_at_k']:.3f}")
+        for message in regressions:
+            self.stderr.write(f"❌ Regression: {message}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions versus {baseline_path}")
+        self.stdout.write(self.style.SUCCESS(f"🎯 No regressions versus {baseline_path}"))
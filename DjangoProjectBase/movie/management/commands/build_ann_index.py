@@ -0,0 +1,60 @@
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from movie.ann import IVFIndex
+from movie.index import embedding_index
+from movie.providers import get_provider
+
+class Command(BaseCommand):
+    help = "Build the approximate nearest-neighbor (IVF) index and measure its recall against exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int, default=settings.MOVIE_ANN_NLIST, help='Number of k-means cells')
+        parser.add_argument('--nprobe', type=int, default=settings.MOVIE_ANN_NPROBE, help='Cells scanned per query')
+        parser.add_argument('--iterations', type=int, default=20, help='k-means iterations')
+        parser.add_argument('--queries', type=int, default=100, help='Number of movies used as queries for the recall check (0 to skip)')
+        parser.add_argument('--k', type=int, default=10, help='k used for recall@k')
+
+    def handle(self, *args, **options):
+        # ✅ Load every stored embedding (exact index)
+        ids, matrix = embedding_index.snapshot()
+        if not len(ids):
+            self.stderr.write("❌ No movies with embeddings found")
+            return
+        self.stdout.write(f"Building IVF index for {len(ids)} movies ({matrix.shape[1]} dimensions)")
+
+        # ✅ Train the centroids and save the index
+        start = time.perf_counter()
+        index = IVFIndex.build(ids, matrix, nlist=options['nlist'], nprobe=options['nprobe'],
+                               iterations=options['iterations'], backend=get_provider().key)
+        path = str(settings.MOVIE_ANN_INDEX_PATH)
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Index with {index.nlist} cells saved to {path} in {time.perf_counter() - start:.2f}s"
+        ))
+
+        # ✅ Compare against exact search using stored movies as queries
+        n_queries = min(options['queries'], len(ids))
+        if not n_queries:
+            return
+        k = options['k']
+        rng = np.random.default_rng(0)
+        queries = matrix[rng.choice(len(ids), n_queries, replace=False)]
+
+        exact_time = ann_time = 0.0
+        hits = 0
+        for query in queries:
+            start = time.perf_counter()
+            exact = {movie_id for movie_id, _ in embedding_index.search(query, k=k)}
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approx = {movie_id for movie_id, _ in index.search(query, k=k)}
+            ann_time += time.perf_counter() - start
+            hits += len(exact & approx)
+
+        recall = hits / (n_queries * min(k, len(ids)))
+        self.stdout.write(f"📊 recall@{k} (nprobe={index.nprobe}): {recall:.3f}")
+        self.stdout.write(f"⏱️  Exact search: {1000 * exact_time / n_queries:.3f} ms/query")
+        self.stdout.write(f"⏱️  IVF search:   {1000 * ann_time / n_queries:.3f} ms/query")
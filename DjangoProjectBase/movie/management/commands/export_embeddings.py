@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from movie import store
+from movie.index import load_from_database
+
+class Command(BaseCommand):
+    help = "Export all movie embeddings to the shared memory-mapped store (MOVIE_EMBEDDING_STORE_DIR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, help='Output directory (defaults to MOVIE_EMBEDDING_STORE_DIR)')
+
+    def handle(self, *args, **options):
+        # ✅ Decode and normalize every stored embedding
+        ids, matrix = load_from_database()
+        self.stdout.write(f"Exporting {len(ids)} embeddings")
+
+        # ✅ Write the new version and atomically swap the manifest
+        manifest = store.export_store(ids, matrix, directory=options.get('dir'))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Exported {manifest['count']} x {manifest['dim']} embeddings to "
+            f"{options.get('dir') or store.store_dir()} (version {manifest['version']})"
+        ))
@@ -0,0 +1,30 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from movie.compression import PCAReducer
+from movie.index import load_from_database
+
+class Command(BaseCommand):
+    help = "Fit the PCA projection used by the reduced-dimension search tier (MOVIE_INDEX_REDUCTION = 'pca')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dim', type=int, default=settings.MOVIE_INDEX_REDUCED_DIM or 256, help='Number of components')
+        parser.add_argument('--samples', type=int, default=20000, help='Maximum number of movies used to fit')
+
+    def handle(self, *args, **options):
+        # ✅ Load the normalized embeddings
+        _, matrix = load_from_database()
+        if len(matrix) < 2:
+            self.stderr.write("❌ Need at least 2 movies with embeddings")
+            return
+
+        # ✅ Fit and save the projection
+        reducer = PCAReducer.fit(matrix, options['dim'], max_samples=options['samples'])
+        path = str(settings.MOVIE_PCA_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        reducer.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ PCA with {reducer.dim} components ({matrix.shape[1]} -> {reducer.dim} dims) saved to {path}"
+        ))
+        if reducer.dim < options['dim']:
+            self.stdout.write(f"Only {reducer.dim} components could be fitted from {len(matrix)} movies")
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from movie.models import Movie
+from movie.posters import render_variants
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants of the movie posters (served with srcset by {% poster %})"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes resizing posters')
+        parser.add_argument('--force', action='store_true', help='Render again variants that are up to date')
+
+    def handle(self, *args, **options):
+        # ✅ Distinct poster files (several movies can share default.jpg)
+        names = sorted(set(Movie.objects.exclude(image='').values_list('image', flat=True)))
+        paths = [os.path.join(settings.MEDIA_ROOT, name) for name in names]
+        missing = [path for path in paths if not os.path.isfile(path)]
+        paths = [path for path in paths if os.path.isfile(path)]
+        self.stdout.write(f"Found {len(names)} posters, {len(missing)} missing on disk")
+
+        # ✅ Resize in a process pool: Pillow resizing/encoding is CPU-bound
+        written = 0
+        failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(render_variants, path, settings.MOVIE_POSTER_WIDTHS, settings.MOVIE_POSTER_FORMATS,
+                                settings.MOVIE_POSTER_QUALITY, options['force']): path
+                for path in paths
+            }
+            for future, path in futures.items():
+                try:
+                    written += future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Failed for {path}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 Finished: {written} variants written for {len(paths) - failed} posters, {failed} failed"))
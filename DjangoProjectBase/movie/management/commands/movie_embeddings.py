@@ -1,53 +1,100 @@
-import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from movie.models import Movie
-from openai import OpenAI
+from movie.embeddings import NORMALIZED, content_hash, normalize, to_blob
+from movie.ann import update_persisted_index
+from movie.providers import get_provider
+from movie.cache import api_cache
+from movie import catalog, store
 from dotenv import load_dotenv
 
 class Command(BaseCommand):
-    help = "Generate and store embeddings for all movies in the database"
+    help = "Generate and store embeddings for the movies whose description changed since the last run"
 
-    def handle(self, *args, **kwargs):
-        # ✅ Load OpenAI API key
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Descriptions sent per API request')
+        parser.add_argument('--workers', type=int, default=4, help='Maximum number of concurrent API requests')
+        parser.add_argument('--cache-only', action='store_true',
+                            help='Only use cached API responses; batches with uncached descriptions fail')
+        parser.add_argument('--force', action='store_true', help='Re-embed every movie, even if its description did not change')
+
+    def handle(self, *args, **options):
+        # ✅ Load OpenAI API key (only used by the 'openai' backend)
         load_dotenv('../api_keys.env')
-        client = OpenAI(api_key=os.environ.get('openai_apikey'))
-
-        # ✅ Get all movies
-        movies = Movie.objects.all()
-        self.stdout.write(f"Found {movies.count()} movies to process")
-
-        def get_embedding(text):
-            response = client.embeddings.create(
-                input=[text],
-                model="text-embedding-3-small"
-            )
-            return np.array(response.data[0].embedding, dtype=np.float32)
-
-        # ✅ Iterate through movies and generate embeddings
-        for movie in movies:
-            try:
-                # Generate embedding
-                emb = get_embedding(movie.description)
-                
-                # Verify embedding is valid
-                if not np.all(np.isfinite(emb)):
-                    self.stderr.write(f"❌ Invalid embedding generated for {movie.title}")
-                    continue
-                    
-                # Store embedding as binary
-                movie.emb = emb.tobytes()
-                movie.save()
-                
-                # Verify the stored embedding
-                stored_emb = np.frombuffer(movie.emb, dtype=np.float32)
-                if not np.array_equal(emb, stored_emb):
-                    self.stderr.write(f"❌ Embedding verification failed for {movie.title}")
+        provider = get_provider()
+        self.stdout.write(f"Embedding backend: {provider.key}")
+
+        # ✅ Select the movies whose description (or backend) changed since their embedding was generated
+        movies = Movie.objects.only('id', 'title', 'description', 'emb_hash', 'emb_backend')
+        pending = []
+        for movie in movies.iterator():
+            if not movie.description:
+                continue
+            new_hash = content_hash(movie.description, provider.key)
+            if options['force'] or movie.emb_hash != new_hash or movie.emb_backend != provider.key:
+                movie.emb_hash = new_hash
+                movie.emb_backend = provider.key
+                pending.append(movie)
+        self.stdout.write(f"Found {len(pending)} movies to process ({movies.count() - len(pending)} unchanged)")
+
+        def get_embeddings(texts):
+            if not provider.remote:
+                return provider.embed(texts)
+            # Solo se envían a la API las descripciones que no están en la caché
+            return api_cache.embeddings(provider.key, texts, provider.embed, cache_only=options['cache_only'])
+
+        batch_size = max(1, options['batch_size'])
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        embedded_ids = []
+        embedded_vectors = []
+
+        # ✅ Send the batches concurrently and store each one as soon as it arrives
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(get_embeddings, [movie.description for movie in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    embeddings = future.result()
+                except Exception as e:
+                    self.stderr.write(f"❌ Failed to generate embeddings for {len(batch)} movies "
+                                      f"({batch[0].title} ...): {e}")
                     continue
-                    
-                self.stdout.write(self.style.SUCCESS(f"✅ Embedding stored for: {movie.title}"))
-                
-            except Exception as e:
-                self.stderr.write(f"❌ Failed to generate embedding for {movie.title}: {e}")
 
-        self.stdout.write(self.style.SUCCESS("🎯 Finished generating embeddings for all movies")) 
\ No newline at end of file
+                valid = []
+                for movie, emb in zip(batch, embeddings):
+                    # Verify embedding is valid
+                    if not np.all(np.isfinite(emb)):
+                        self.stderr.write(f"❌ Invalid embedding generated for {movie.title}")
+                        continue
+                    # Store the L2-normalized embedding as binary
+                    emb = normalize(emb)
+                    movie.emb = to_blob(emb)
+                    movie.emb_version = NORMALIZED
+                    valid.append(movie)
+                    embedded_ids.append(movie.id)
+                    embedded_vectors.append(emb)
+
+                with transaction.atomic():
+                    Movie.objects.bulk_update(valid, ['emb', 'emb_version', 'emb_hash', 'emb_backend'])
+                self.stdout.write(self.style.SUCCESS(f"✅ Embeddings stored for {len(valid)} movies"))
+
+        # ✅ bulk_update sends no post_save: tell the running servers to rebuild their indexes
+        if embedded_ids:
+            catalog.touch()
+
+        # ✅ Insert the new embeddings into the approximate index, if it has been built
+        if embedded_ids and update_persisted_index(embedded_ids, np.array(embedded_vectors), provider.key):
+            self.stdout.write(f"Updated approximate index with {len(embedded_ids)} movies")
+
+        # ✅ Swap in a new version of the shared embedding store, if it is in use
+        if embedded_ids and store.manifest_mtime() is not None:
+            call_command('export_embeddings', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f"🎯 Finished generating embeddings ({len(embedded_ids)} movies updated)"))
@@ -0,0 +1,126 @@
+import hashlib
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from movie.index import load_from_database
+from movie.models import Movie, MovieNeighbor
+
+def row_top_k(scores, k):
+    """Column indices of the ``k`` highest values of each row, best first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+class Command(BaseCommand):
+    help = "Precompute the top-k most similar movies of every movie from the stored embeddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Neighbors stored per movie')
+        parser.add_argument('--block-size', type=int, default=1024, help='Rows/columns per block of the similarity matrix')
+        parser.add_argument('--full', action='store_true', help='Recompute every movie instead of only the changed ones')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        block = max(1, options['block_size'])
+
+        # ✅ Load the normalized embeddings (no API calls)
+        ids, matrix = load_from_database()
+        n = len(ids)
+        if n < 2:
+            self.stderr.write("❌ Need at least 2 movies with embeddings")
+            return
+        k = min(k, n - 1)
+        hashes = np.array([hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest() for row in matrix])
+
+        # ✅ Find the movies whose embedding changed (or whose list lost neighbors)
+        # Toda la tabla, sin una lista IN con todo el catálogo (SQLite limita el número de parámetros)
+        stored_hashes = dict(Movie.objects.values_list('id', 'neighbors_hash').iterator())
+        counts = dict(MovieNeighbor.objects.values('movie').annotate(n=Count('id')).values_list('movie', 'n'))
+        if options['full']:
+            changed = np.ones(n, dtype=bool)
+        else:
+            changed = np.array([
+                stored_hashes.get(int(movie_id)) != h or counts.get(int(movie_id), 0) < k
+                for movie_id, h in zip(ids, hashes)
+            ])
+            # Lists pointing at a changed movie are recomputed too: the others stay
+            # exact by merging in the new scores of the changed movies below
+            changed_ids = ids[changed].tolist()
+            referencing = set()
+            for start in range(0, len(changed_ids), block):
+                referencing.update(MovieNeighbor.objects.filter(
+                    neighbor_id__in=changed_ids[start:start + block]).values_list('movie_id', flat=True))
+            changed |= np.isin(ids, list(referencing))
+        changed_rows = np.flatnonzero(changed)
+        self.stdout.write(f"{len(changed_rows)} of {n} movies need new neighbors")
+        if not len(changed_rows):
+            self.stdout.write(self.style.SUCCESS("🎯 Neighbor table is up to date"))
+            return
+
+        # ✅ Changed movies: blocked similarity against the whole catalog, keeping a running top-k
+        new_lists = {}
+        for start in range(0, len(changed_rows), block):
+            rows = changed_rows[start:start + block]
+            vectors = matrix[rows]
+            best_scores = np.full((len(rows), 0), -np.inf, dtype=np.float32)
+            best_cols = np.empty((len(rows), 0), dtype=np.int64)
+            for col_start in range(0, n, block):
+                scores = vectors @ matrix[col_start:col_start + block].T
+                cols = np.arange(col_start, col_start + scores.shape[1])
+                scores[rows[:, None] == cols[None, :]] = -np.inf  # a movie is not its own neighbor
+                all_scores = np.concatenate([best_scores, scores], axis=1)
+                all_cols = np.concatenate([best_cols, np.broadcast_to(cols, scores.shape)], axis=1)
+                top = row_top_k(all_scores, k)
+                best_scores = np.take_along_axis(all_scores, top, axis=1)
+                best_cols = np.take_along_axis(all_cols, top, axis=1)
+            for row, cols, scores in zip(rows, best_cols, best_scores):
+                new_lists[int(ids[row])] = [(int(ids[c]), float(s)) for c, s in zip(cols, scores)]
+
+        # ✅ Unchanged movies: merge in the new scores of the changed ones
+        changed_ids = set(new_lists)
+        if not options['full']:
+            unchanged_rows = np.flatnonzero(~changed)
+            unchanged_ids = set(ids[unchanged_rows].tolist())
+            old_lists = {}
+            for movie_id, neighbor_id, score in MovieNeighbor.objects.order_by('movie', 'rank').values_list(
+                    'movie_id', 'neighbor_id', 'score').iterator():
+                if movie_id in unchanged_ids:
+                    old_lists.setdefault(movie_id, []).append((neighbor_id, score))
+            for start in range(0, len(unchanged_rows), block):
+                rows = unchanged_rows[start:start + block]
+                vectors = matrix[rows]
+                candidates = {
+                    int(ids[row]): [item for item in old_lists.get(int(ids[row]), []) if item[0] not in changed_ids]
+                    for row in rows
+                }
+                for col_start in range(0, len(changed_rows), block):
+                    cols = changed_rows[col_start:col_start + block]
+                    scores = vectors @ matrix[cols].T
+                    for row, row_scores in zip(rows, scores):
+                        candidates[int(ids[row])].extend(
+                            (int(ids[c]), float(s)) for c, s in zip(cols, row_scores))
+                for movie_id, items in candidates.items():
+                    merged = sorted(items, key=lambda item: -item[1])[:k]
+                    if merged != old_lists.get(movie_id):
+                        new_lists[movie_id] = merged
+
+        # ✅ Write the new lists in chunked transactions
+        movie_ids = list(new_lists)
+        hash_of = {int(movie_id): h for movie_id, h in zip(ids, hashes)}
+        for start in range(0, len(movie_ids), block):
+            chunk = movie_ids[start:start + block]
+            with transaction.atomic():
+                MovieNeighbor.objects.filter(movie_id__in=chunk).delete()
+                MovieNeighbor.objects.bulk_create([
+                    MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, rank=rank, score=score)
+                    for movie_id in chunk
+                    for rank, (neighbor_id, score) in enumerate(new_lists[movie_id])
+                ])
+                Movie.objects.bulk_update(
+                    [Movie(id=movie_id, neighbors_hash=hash_of[movie_id]) for movie_id in chunk if movie_id in changed_ids],
+                    ['neighbors_hash'],
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"🎯 Stored {k} neighbors for {len(movie_ids)} movies"))
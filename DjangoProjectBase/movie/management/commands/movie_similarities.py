@@ -1,17 +1,21 @@
-import os
 import numpy as np
 from django.core.management.base import BaseCommand
 from movie.models import Movie
-from openai import OpenAI
+from movie.cache import api_cache
+from movie.embeddings import NORMALIZED, content_hash, from_blob, normalize
+from movie.providers import get_provider
 from dotenv import load_dotenv
 
 class Command(BaseCommand):
     help = "Compare two movies and optionally a prompt using OpenAI embeddings"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--cache-only', action='store_true', help='Only use stored embeddings and cached API responses')
+
     def handle(self, *args, **kwargs):
         # ✅ Load OpenAI API key
         load_dotenv('../api_keys.env')
-        client = OpenAI(api_key=os.environ.get('openai_apikey'))
+        provider = get_provider()
 
         try:
             # ✅ Get the first two movies from the database
@@ -26,18 +30,25 @@ class Command(BaseCommand):
             self.stdout.write(f"Comparing movies: {movie1.title} and {movie2.title}")
 
             def get_embedding(text):
-                response = client.embeddings.create(
-                    input=[text],
-                    model="text-embedding-3-small"
-                )
-                return np.array(response.data[0].embedding, dtype=np.float32)
+                if not provider.remote:
+                    return provider.embed([text])[0]
+                return normalize(api_cache.embeddings(provider.key, [text], provider.embed,
+                                                      cache_only=kwargs['cache_only'])[0])
+
+            def movie_embedding(movie):
+                # Se reutiliza el embedding guardado si corresponde a la descripción y al proveedor actuales
+                if (movie.emb and movie.emb_backend == provider.key and movie.emb_version >= NORMALIZED
+                        and movie.emb_hash == content_hash(movie.description, provider.key)):
+                    return from_blob(movie.emb)
+                return get_embedding(movie.description)
 
             def cosine_similarity(a, b):
-                return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+                # Los embeddings ya están normalizados: el coseno es el producto punto
+                return np.dot(a, b)
 
             # ✅ Generate embeddings of both movies
-            emb1 = get_embedding(movie1.description)
-            emb2 = get_embedding(movie2.description)
+            emb1 = movie_embedding(movie1)
+            emb2 = movie_embedding(movie2)
 
             # ✅ Compute similarity between movies
             similarity = cosine_similarity(emb1, emb2)
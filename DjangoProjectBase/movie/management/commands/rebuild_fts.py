@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from movie import fts
+from movie.models import Movie
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite FTS5 full-text index used by the home page search"
+
+    def handle(self, *args, **kwargs):
+        if not fts.available():
+            self.stderr.write("❌ Full-text search needs the SQLite backend")
+            return
+
+        # ✅ Repopulate the index from the movie table
+        fts.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"🎯 Full-text index rebuilt for {Movie.objects.count()} movies"))
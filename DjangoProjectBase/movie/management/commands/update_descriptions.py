@@ -1,71 +1,88 @@
-import os
-from openai import OpenAI
+import csv
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from movie import catalog
 from movie.models import Movie
+from movie.pipeline import Checkpoint, DescriptionGenerator, add_description_arguments, run_concurrently
 from dotenv import load_dotenv
 
 class Command(BaseCommand):
-    help = "Update movie descriptions using OpenAI API"
+    help = "Update movie descriptions using OpenAI API (concurrent, rate-limited and resumable)"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        add_description_arguments(parser)
+        parser.add_argument('--batch-size', type=int, default=50, help='Descriptions saved per transaction')
+        parser.add_argument('--limit', type=int, help='Process at most this many movies')
+        parser.add_argument('--csv', type=str, help='Also stream the new descriptions to this CSV file')
+        parser.add_argument('--checkpoint', type=str,
+                            default=str(settings.DATA_DIR / 'checkpoints' / 'update_descriptions.jsonl'),
+                            help='File with the movies already updated, used to resume an interrupted run')
+
+    def handle(self, *args, **options):
         # ✅ Load environment variables from the .env file
         load_dotenv('../api_keys.env')
 
-        # ✅ Initialize the OpenAI client with the API key
-        client = OpenAI(
-            api_key=os.environ.get('openai_apikey'),
-        )
-
-        # ✅ Helper function to send prompt and get completion from OpenAI
-        def get_completion(prompt, model="gpt-3.5-turbo"):
-            messages = [{"role": "user", "content": prompt}]
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,  # No creativity, deterministic response
-            )
-            return response.choices[0].message.content.strip()
-
-        # ✅ Instruction to guide the AI response (clear, concise, with genre info)
-        instruction = (
-            "Vas a actuar como un aficionado del cine que sabe describir de forma clara, "
-            "concisa y precisa cualquier película en menos de 200 palabras. La descripción "
-            "debe incluir el género de la película y cualquier información adicional que sirva "
-            "para crear un sistema de recomendación."
-        )
+        # ✅ OpenAI client, rate limiter and API cache (retries are handled by call_with_retries)
+        get_completion = DescriptionGenerator.from_options(options)
+        checkpoint = Checkpoint(options['checkpoint'], restart=options['restart'])
 
-        # ✅ Fetch all movies from the database
-        movies = Movie.objects.all()
-        self.stdout.write(f"Found {movies.count()} movies")
+        # ✅ Fetch the movies not updated yet (skipping the ones in the checkpoint)
+        movies = Movie.objects.only('id', 'title', 'description').order_by('id')
+        pending = [movie for movie in movies.iterator() if movie.id not in checkpoint]
+        if options['limit'] is not None:
+            pending = pending[:options['limit']]
+        self.stdout.write(f"Found {movies.count()} movies, {len(pending)} to update "
+                          f"({len(checkpoint.done)} already done according to {checkpoint.path})")
 
-        # ✅ Process each movie
-        for movie in movies:
-            self.stdout.write(f"Processing: {movie.title}")
-            try:
-                # ✅ Construct the prompt combining the instruction and the current description
-                prompt = (
-                    f"{instruction} "
-                    f"Vas a actualizar la descripción '{movie.description}' de la película '{movie.title}'."
-                )
+        csv_file = None
+        writer = None
+        if options['csv']:
+            # Sin checkpoint se empieza un CSV nuevo; al reanudar se añade al existente
+            csv_file = open(options['csv'], mode='a' if checkpoint.done else 'w', newline='', encoding='utf-8')
+            writer = csv.writer(csv_file)
+            if not checkpoint.done:
+                writer.writerow(['Title', 'Updated Description'])
 
-                # ✅ Optional: Log current movie data
-                print(f"Title: {movie.title}")
-                print(f"Original Description: {movie.description}")
+        updated = []
+        failed = 0
+        completed = False
 
-                # ✅ Get the new description from the AI
-                updated_description = get_completion(prompt)
+        def flush():
+            # Guardar el lote y luego marcarlo en el checkpoint: nada se pierde si el proceso se interrumpe
+            with transaction.atomic():
+                Movie.objects.bulk_update(updated, ['description'])
+            catalog.touch()  # bulk_update no envía señales: los servidores recargan el índice BM25
+            if csv_file:
+                csv_file.flush()
+            checkpoint.mark([movie.id for movie in updated])
+            updated.clear()
 
-                # ✅ Optional: Log AI response
-                print(f"Updated Description: {updated_description}")
-
-                # ✅ Save the new description to the database
+        # ✅ Process the movies concurrently, saving each result as it arrives
+        try:
+            for movie, updated_description, error in run_concurrently(pending, get_completion, options['workers']):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f"Failed for {movie.title}: {str(error)}")
+                    continue
                 movie.description = updated_description
-                movie.save()
-
+                updated.append(movie)
+                if writer:
+                    writer.writerow([movie.title, updated_description])
                 self.stdout.write(self.style.SUCCESS(f"Updated: {movie.title}"))
+                if len(updated) >= options['batch_size']:
+                    flush()
+            completed = True
+        finally:
+            if updated:
+                flush()
+            # ✅ Run finished with every movie updated: the next run starts from scratch
+            if completed and not failed and options['limit'] is None:
+                checkpoint.finish()
+            else:
+                checkpoint.close()
+            if csv_file:
+                csv_file.close()
 
-            except Exception as e:
-                self.stderr.write(f"Failed for {movie.title}: {str(e)}")
-
-            # ✅ Remove the break to process all movies
-            break  # Remove or comment this line to process all movies
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 Finished: {len(pending) - failed} descriptions updated, {failed} failed"))
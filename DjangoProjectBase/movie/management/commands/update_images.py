@@ -1,73 +1,153 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from movie.models import Movie
+from movie.cache import CacheMiss, api_cache
+from movie.pipeline import RateLimiter, call_with_retries, run_concurrently
+from movie.posters import atomic_write, generate_variants
 from dotenv import load_dotenv
 
+# (conexión, lectura) en segundos para descargar cada póster
+DOWNLOAD_TIMEOUT = (10, 60)
+CHUNK_SIZE = 1 << 16
+
+
 class Command(BaseCommand):
-    help = "Generate images with OpenAI and update movie image field"
+    help = "Generate images with OpenAI and update movie image field (concurrent, resumable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Maximum number of posters generated at the same time')
+        parser.add_argument('--rpm', type=int, default=50, help='Image generation requests per minute allowed by the account')
+        parser.add_argument('--retries', type=int, default=5, help='Retries on 429/5xx/timeouts')
+        parser.add_argument('--limit', type=int, help='Process at most this many movies')
+        parser.add_argument('--overwrite', action='store_true', help='Request new posters from the API, even if the file or a cached image exists')
+        parser.add_argument('--cache-only', action='store_true', help='Only use cached images, never call the API')
+
+    def handle(self, *args, **options):
+        if options['overwrite'] and options['cache_only']:
+            raise CommandError("--overwrite requests new images from the API and cannot be used with --cache-only")
 
-    def handle(self, *args, **kwargs):
         # ✅ Load environment variables from the .env file
         load_dotenv('../api_keys.env')
 
-        # ✅ Initialize the OpenAI client with the API key
+        # ✅ Initialize the OpenAI client (retries are handled by call_with_retries)
         client = OpenAI(
             api_key=os.environ.get('openai_apikey'),
+            max_retries=0,
+            timeout=120,
         )
+        # ✅ One HTTP session for every download: keep-alive connections, one per worker
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=options['workers']))
+        limiter = RateLimiter(requests_per_minute=options['rpm'])
+
         # ✅ Folder to save images
-        images_folder = 'media/movie/images/'
+        images_folder = os.path.join(settings.MEDIA_ROOT, 'movie', 'images')
         os.makedirs(images_folder, exist_ok=True)
 
         # ✅ Fetch all movies
-        movies = Movie.objects.all()
-        self.stdout.write(f"Found {movies.count()} movies")
-
-        for movie in movies:
-            try:
-                # ✅ Call the helper function
-                image_relative_path = self.generate_and_download_image(client, movie.title, images_folder)
+        movies = Movie.objects.only('id', 'title', 'image').order_by('id')
+        if options['limit'] is not None:
+            movies = movies[:options['limit']]
+        movies = list(movies)
+        self.stdout.write(f"Found {len(movies)} movies")
 
-                # ✅ Update database
-                movie.image = image_relative_path
-                movie.save()
-                self.stdout.write(self.style.SUCCESS(f"Saved and updated image for: {movie.title}"))
+        def work(movie):
+            return self.generate_and_download_image(client, session, limiter, movie.title, images_folder,
+                                                    overwrite=options['overwrite'],
+                                                    cache_only=options['cache_only'],
+                                                    retries=options['retries'])
 
-            except Exception as e:
-                self.stderr.write(f"Failed for {movie.title}: {e}")
+        updated = []
+        failed = 0
+        skipped = 0
+        try:
+            # ✅ Generate and download the posters concurrently
+            for movie, result, error in run_concurrently(movies, work, options['workers']):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f"Failed for {movie.title}: {error}")
+                    continue
+                image_relative_path, created = result
+                if not created:
+                    skipped += 1
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"Saved image for: {movie.title}"))
+                if movie.image.name != image_relative_path:
+                    movie.image = image_relative_path
+                    updated.append(movie)
+        finally:
+            # ✅ Update database: one bulk_update at the end (also after Ctrl+C, for the posters already saved)
+            with transaction.atomic():
+                Movie.objects.bulk_update(updated, ['image'], batch_size=500)
+            session.close()
 
-            # 🔎 Process just the first movie for demonstration
-            break
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 Finished: {len(updated)} movies updated, {skipped} posters already on disk, {failed} failed"))
 
-        self.stdout.write(self.style.SUCCESS("Process finished (only first movie updated)."))
-
-    def generate_and_download_image(self, client, movie_title, save_folder):
+    def generate_and_download_image(self, client, session, limiter, movie_title, save_folder,
+                                    overwrite=False, cache_only=False, retries=5):
         """
         Generates an image using OpenAI's DALL·E model and downloads it.
-        Returns the relative image path or raises an exception.
+        Returns ``(relative image path, created)`` or raises an exception;
+        ``created`` is False when the poster was already on disk.
         """
+        # ✅ Prepare the filename and full save path
+        image_filename = f"m_{movie_title}.png".replace('/', '_')
+        image_path_full = os.path.join(save_folder, image_filename)
+        image_relative_path = os.path.join('movie/images', image_filename)
+        if not overwrite and os.path.exists(image_path_full):
+            return image_relative_path, False
+
         prompt = f"Movie poster of {movie_title}"
+        request = {
+            'model': "dall-e-2",
+            'prompt': prompt,
+            'size': "256x256",
+            'quality': "standard",
+            'n': 1,
+        }
+
+        # Los bytes de la imagen se guardan en la caché de la API: regenerarla no cuesta nada.
+        # Con --overwrite se pide una imagen nueva a la API (la respuesta reemplaza la guardada)
+        image_bytes = None if overwrite else api_cache.get('images.generate', request)
+        if image_bytes is not None:
+            with atomic_write(image_path_full) as f:
+                f.write(image_bytes)
+            self.save_variants(image_relative_path)
+            return image_relative_path, True
+        if cache_only:
+            raise CacheMiss(f"No cached image for {movie_title}")
 
         # ✅ Generate image with OpenAI
-        response = client.images.generate(
-            model="dall-e-2",
-            prompt=prompt,
-            size="256x256",
-            quality="standard",
-            n=1,
-        )
+        def generate():
+            limiter.acquire()
+            return client.images.generate(**request)
+
+        response = call_with_retries(generate, max_retries=retries)
         image_url = response.data[0].url
 
-        # ✅ Prepare the filename and full save path
-        image_filename = f"m_{movie_title}.png"
-        image_path_full = os.path.join(save_folder, image_filename)
+        # ✅ Download the image, streamed to a temporary file that replaces the poster only when complete
+        def download():
+            with session.get(image_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as image_response:
+                image_response.raise_for_status()
+                with atomic_write(image_path_full) as f:
+                    for chunk in image_response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
 
-        # ✅ Download the image
-        image_response = requests.get(image_url)
-        image_response.raise_for_status()
-        with open(image_path_full, 'wb') as f:
-            f.write(image_response.content)
+        call_with_retries(download, max_retries=retries)
+        with open(image_path_full, 'rb') as f:
+            api_cache.set('images.generate', request, f.read())
+        self.save_variants(image_relative_path)
 
         # ✅ Return relative path to be saved in the DB
-        return os.path.join('movie/images', image_filename)
+        return image_relative_path, True
+
+    def save_variants(self, image_relative_path):
+        # bulk_update no envía post_save: las variantes (srcset) se generan aquí
+        if settings.MOVIE_POSTER_VARIANTS_ON_SAVE:
+            generate_variants(image_relative_path)
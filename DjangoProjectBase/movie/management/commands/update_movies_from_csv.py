@@ -1,14 +1,22 @@
 import os
 import csv
 from django.core.management.base import BaseCommand
-from movie.models import Movie
+from django.db import transaction
+from movie import catalog
+from movie.models import Movie, first_genre_of, sync_genres
 
 class Command(BaseCommand):
     help = "Update movie descriptions in the database from a CSV file"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', type=str, default='updated_movie_descriptions.csv', help='CSV file to import')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction')
+
+    def handle(self, *args, **options):
         # 📥 Ruta del archivo CSV con las descripciones actualizadas
-        csv_file = 'updated_movie_descriptions.csv'
+        csv_file = options['csv']
+        batch_size = max(1, options['batch_size'])
+        verbose = options['verbosity'] >= 2
 
         # ✅ Verifica si el archivo existe
         if not os.path.exists(csv_file):
@@ -16,52 +24,75 @@ class Command(BaseCommand):
             return
 
         self.stdout.write(f"Processing CSV file: {csv_file}")
+
+        # ✅ Títulos existentes en una sola consulta: título -> (id, descripción)
+        existing = {}
+        for movie_id, title, description in Movie.objects.values_list('id', 'title', 'description').order_by('id'):
+            existing.setdefault(title, (movie_id, description))
+
+        total_rows = 0
         updated_count = 0
         created_count = 0
+        unchanged_count = 0
         error_count = 0
+        to_create = {}
+        to_update = {}
 
-        # 📖 Abrimos el CSV y leemos cada fila
-        with open(csv_file, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            total_rows = sum(1 for row in reader)
-            self.stdout.write(f"Total rows in CSV: {total_rows}")
-            
-            # Volvemos al inicio del archivo
-            file.seek(0)
-            next(reader)  # Saltamos la cabecera
-            
-            for row in reader:
-                title = row['Title']
-                new_description = row['Updated Description']
-
-                self.stdout.write(f"\nProcessing movie: {title}")
-                self.stdout.write(f"Description length: {len(new_description)} characters")
+        def flush():
+            # Un lote por transacción: bulk_create/bulk_update en lugar de una consulta por fila
+            with transaction.atomic():
+                created = Movie.objects.bulk_create(to_create.values())
+                Movie.objects.bulk_update(to_update.values(), ['description'])
+                sync_genres(created)
+            for movie in created:
+                existing[movie.title] = (movie.id, movie.description)
+            to_create.clear()
+            to_update.clear()
 
+        # 📖 Una sola pasada por el CSV
+        with open(csv_file, mode='r', encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                total_rows += 1
                 try:
-                    # Buscar la película por título
-                    movie, created = Movie.objects.get_or_create(
-                        title=title,
-                        defaults={
-                            'description': new_description,
-                            'image': 'movie/images/default.jpg',
-                            'genre': 'Drama',
-                            'year': 2023
-                        }
-                    )
+                    title = row['Title']
+                    new_description = row['Updated Description']
+                except KeyError as e:
+                    error_count += 1
+                    self.stderr.write(self.style.ERROR(f"Error processing row {total_rows}: missing column {e}"))
+                    continue
 
-                    if not created:
-                        # Si la película ya existe, actualizamos su descripción
-                        movie.description = new_description
-                        movie.save()
-                        updated_count += 1
+                if title in to_create:
+                    # Título repetido en el CSV: gana la última fila
+                    to_create[title].description = new_description
+                elif title in existing:
+                    movie_id, description = existing[title]
+                    if description == new_description:
+                        unchanged_count += 1
+                        continue
+                    # Si la película ya existe, actualizamos su descripción
+                    to_update[movie_id] = Movie(id=movie_id, description=new_description)
+                    existing[title] = (movie_id, new_description)
+                    updated_count += 1
+                    if verbose:
                         self.stdout.write(self.style.SUCCESS(f"Updated: {title}"))
-                    else:
-                        created_count += 1
+                else:
+                    to_create[title] = Movie(
+                        title=title,
+                        description=new_description,
+                        image='movie/images/default.jpg',
+                        genre='Drama',
+                        first_genre=first_genre_of('Drama'),
+                        year=2023,
+                    )
+                    created_count += 1
+                    if verbose:
                         self.stdout.write(self.style.SUCCESS(f"Created: {title}"))
 
-                except Exception as e:
-                    error_count += 1
-                    self.stderr.write(self.style.ERROR(f"Error processing {title}: {str(e)}"))
+                if len(to_create) + len(to_update) >= batch_size:
+                    flush()
+        flush()
+        # ✅ bulk_create/bulk_update no envían señales: los servidores en marcha recargan sus índices
+        catalog.touch()
 
         # ✅ Al finalizar, muestra un resumen detallado
         self.stdout.write("\n" + "="*50)
@@ -69,5 +100,6 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f"- Total rows processed: {total_rows}"))
         self.stdout.write(self.style.SUCCESS(f"- Movies updated: {updated_count}"))
         self.stdout.write(self.style.SUCCESS(f"- Movies created: {created_count}"))
+        self.stdout.write(self.style.SUCCESS(f"- Movies unchanged: {unchanged_count}"))
         self.stdout.write(self.style.ERROR(f"- Errors encountered: {error_count}"))
-        self.stdout.write("="*50) 
\ No newline at end of file
+        self.stdout.write("="*50)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:59
+
+import numpy as np
+from django.db import migrations, models
+
+
+def normalize_embeddings(apps, schema_editor):
+    # Normaliza los embeddings existentes para que la similitud de coseno sea un producto punto
+    Movie = apps.get_model('movie', 'Movie')
+    for movie in Movie.objects.filter(emb_version=0).only('id', 'emb').iterator():
+        if not movie.emb:
+            continue
+        vector = np.frombuffer(movie.emb, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not np.isfinite(norm) or norm == 0:
+            continue
+        movie.emb = (vector / norm).astype(np.float32).tobytes()
+        movie.emb_version = 1
+        movie.save(update_fields=['emb', 'emb_version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0004_movie_emb_alter_movie_description_alter_movie_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='emb_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(normalize_embeddings, migrations.RunPython.noop),
+    ]
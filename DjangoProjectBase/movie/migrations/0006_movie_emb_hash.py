@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0005_movie_emb_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='emb_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0006_movie_emb_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='neighbors_hash',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='MovieNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='movie.movie')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movie.movie')),
+            ],
+            options={
+                'ordering': ['movie', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'rank'), name='unique_movie_neighbor_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def mark_openai_embeddings(apps, schema_editor):
+    # Los embeddings existentes de 1536 dimensiones se generaron con text-embedding-3-small;
+    # los demás son el valor aleatorio por defecto del modelo
+    Movie = apps.get_model('movie', 'Movie')
+    ids = [movie_id for movie_id, emb in Movie.objects.values_list('id', 'emb').iterator()
+           if emb and len(emb) == 1536 * 4]
+    for start in range(0, len(ids), 500):
+        Movie.objects.filter(id__in=ids[start:start + 500]).update(emb_backend='text-embedding-3-small')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0007_movie_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='emb_backend',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(mark_openai_embeddings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS movie_movie_fts USING fts5(
+        title, genre, description,
+        content='movie_movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_movie_fts_ai AFTER INSERT ON movie_movie BEGIN
+        INSERT INTO movie_movie_fts(rowid, title, genre, description)
+        VALUES (new.id, new.title, new.genre, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_movie_fts_ad AFTER DELETE ON movie_movie BEGIN
+        INSERT INTO movie_movie_fts(movie_movie_fts, rowid, title, genre, description)
+        VALUES ('delete', old.id, old.title, old.genre, old.description);
+    END
+    """,
+    # Solo cuando cambia una columna indexada (no al guardar emb, neighbors_hash, ...)
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_movie_fts_au AFTER UPDATE OF title, genre, description ON movie_movie BEGIN
+        INSERT INTO movie_movie_fts(movie_movie_fts, rowid, title, genre, description)
+        VALUES ('delete', old.id, old.title, old.genre, old.description);
+        INSERT INTO movie_movie_fts(rowid, title, genre, description)
+        VALUES (new.id, new.title, new.genre, new.description);
+    END
+    """,
+    "INSERT INTO movie_movie_fts(movie_movie_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS movie_movie_fts_ai",
+    "DROP TRIGGER IF EXISTS movie_movie_fts_ad",
+    "DROP TRIGGER IF EXISTS movie_movie_fts_au",
+    "DROP TABLE IF EXISTS movie_movie_fts",
+]
+
+
+def run_on_sqlite(statements):
+    # FTS5 solo existe en SQLite; con otros motores la búsqueda usa icontains
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0008_movie_emb_backend'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
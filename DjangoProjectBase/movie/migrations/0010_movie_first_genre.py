@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+def fill_first_genre(apps, schema_editor):
+    # Mismo cálculo que models.first_genre_of
+    Movie = apps.get_model('movie', 'Movie')
+    movies = []
+    for movie_id, genre in Movie.objects.values_list('id', 'genre').iterator():
+        first_genre = (genre or '').split(',')[0].strip()
+        if first_genre:
+            movies.append(Movie(id=movie_id, first_genre=first_genre))
+    Movie.objects.bulk_update(movies, ['first_genre'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0009_movie_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='first_genre',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=250),
+        ),
+        migrations.RunPython(fill_first_genre, migrations.RunPython.noop),
+    ]
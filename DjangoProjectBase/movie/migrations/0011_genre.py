@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+def fill_genres(apps, schema_editor):
+    # Separa el texto de Movie.genre ("Drama, Crime") en filas de Genre (ver models.genre_names_of)
+    Movie = apps.get_model('movie', 'Movie')
+    Genre = apps.get_model('movie', 'Genre')
+    Through = Movie.genres.through
+    genre_ids = {}
+    links = []
+    for movie_id, genre in Movie.objects.values_list('id', 'genre').iterator():
+        seen = set()
+        for name in (genre or '').split(','):
+            name = name.strip()
+            if not name or name.lower() in seen:
+                continue
+            seen.add(name.lower())
+            if name.lower() not in genre_ids:
+                genre_ids[name.lower()] = Genre.objects.create(name=name).id
+            links.append(Through(movie_id=movie_id, genre_id=genre_ids[name.lower()]))
+    Through.objects.bulk_create(links, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0010_movie_first_genre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genres',
+            field=models.ManyToManyField(blank=True, related_name='movies', to='movie.genre'),
+        ),
+        migrations.RunPython(fill_genres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0011_genre'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='title',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
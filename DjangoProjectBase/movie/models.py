@@ -5,16 +5,112 @@ def get_default_array():
     default_arr = np.random.rand(1536)
     return default_arr.tobytes()
 
+def first_genre_of(genre):
+    """``'Drama, Crime'`` -> ``'Drama'`` (cadena vacía si no hay género)"""
+    return (genre or '').split(',')[0].strip()
+
+def genre_names_of(genre):
+    """``'Drama, Crime, drama'`` -> ``['Drama', 'Crime']`` (sin repetidos, en orden)"""
+    names = {}
+    for name in (genre or '').split(','):
+        name = name.strip()
+        if name and name.lower() not in names:
+            names[name.lower()] = name
+    return list(names.values())
+
 # create your models here
 
+class Genre(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Movie(models.Model): 
-    title = models.CharField(max_length=100)
+    title = models.CharField(max_length=100, db_index=True)
     description = models.CharField(max_length=1500) 
     image = models.ImageField(upload_to='movie/images/', default = 'movie/images/default.jpg') 
     url = models.URLField(blank=True)
     genre = models.CharField(blank=True, max_length=250)
+    # Primer género de `genre`, precalculado e indexado para agrupar en la base de datos
+    first_genre = models.CharField(blank=True, max_length=250, db_index=True, editable=False)
+    # Géneros normalizados a partir de `genre` (ver sync_genres)
+    genres = models.ManyToManyField(Genre, related_name='movies', blank=True)
     year = models.IntegerField(blank=True, null=True)
     emb = models.BinaryField(default=get_default_array())
+    # 0: vector sin normalizar, 1: vector con norma L2 = 1 (ver movie/embeddings.py)
+    emb_version = models.PositiveSmallIntegerField(default=0)
+    # Hash del modelo y la descripción usados para generar emb (vacío si nunca se generó)
+    emb_hash = models.CharField(blank=True, max_length=64)
+    # Proveedor que generó emb (ver movie/providers.py); vacío si emb es el valor por defecto
+    emb_backend = models.CharField(blank=True, max_length=64)
+    # Hash del vector con el que se calcularon sus vecinos (ver el comando movie_neighbors)
+    neighbors_hash = models.CharField(blank=True, max_length=32)
+
+    def save(self, *args, **kwargs):
+        self.first_genre = first_genre_of(self.genre)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'genre' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'first_genre'}
+        super().save(*args, **kwargs)
+        if update_fields is None or 'genre' in update_fields:
+            sync_genres([self])
 
     def __str__(self): 
         return self.title
+
+
+class MovieNeighbor(models.Model):
+    """Precomputed top-k most similar movies for each movie (see the movie_neighbors command)."""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['movie', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'rank'], name='unique_movie_neighbor_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.movie} -> {self.neighbor} ({self.score:.3f})'
+
+
+def sync_genres(movies):
+    """
+    Make the ``genres`` relation of ``movies`` match their ``genre`` text,
+    creating the missing ``Genre`` rows. Works in a fixed number of queries
+    for any number of movies, so importers can call it once per batch.
+    """
+    movies = [movie for movie in movies if movie.pk is not None]
+    if not movies:
+        return
+    wanted = {movie.pk: genre_names_of(movie.genre) for movie in movies}
+    names = {name for movie_names in wanted.values() for name in movie_names}
+
+    # Los géneros se comparan sin distinguir mayúsculas ("drama" == "Drama")
+    genre_ids = {name.lower(): genre_id for genre_id, name in Genre.objects.values_list('id', 'name')}
+    missing = {name.lower(): name for name in names if name.lower() not in genre_ids}
+    if missing:
+        Genre.objects.bulk_create([Genre(name=name) for name in missing.values()], ignore_conflicts=True)
+        genre_ids = {name.lower(): genre_id for genre_id, name in Genre.objects.values_list('id', 'name')}
+
+    Through = Movie.genres.through
+    current = {}
+    for movie_id, genre_id in Through.objects.filter(movie_id__in=wanted).values_list('movie_id', 'genre_id'):
+        current.setdefault(movie_id, set()).add(genre_id)
+    stale = []
+    links = []
+    for movie_id, movie_names in wanted.items():
+        target = {genre_ids[name.lower()] for name in movie_names}
+        if current.get(movie_id, set()) != target:
+            stale.append(movie_id)
+            links += [Through(movie_id=movie_id, genre_id=genre_id) for genre_id in target]
+    if stale:
+        Through.objects.filter(movie_id__in=stale).delete()
+        Through.objects.bulk_create(links)
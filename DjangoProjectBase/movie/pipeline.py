@@ -0,0 +1,248 @@
+"""
+Building blocks for batch jobs that call the OpenAI API once per movie
+(``update_descriptions``, ``update_and_export_movies``, ``update_images``).
+
+* ``RateLimiter``: token buckets for requests and tokens per minute, shared
+  by every worker thread, so the job stays under the account limits instead
+  of bouncing off 429 errors.
+* ``call_with_retries``: retries 429, 5xx, timeouts and connection errors
+  (from the OpenAI client or from ``requests`` downloads) with exponential
+  backoff and jitter (honoring ``Retry-After``).
+* ``Checkpoint``: append-only JSON-lines file with the keys already done, so
+  an interrupted run resumes where it stopped. ``finish`` deletes it once a
+  run completes, so the next run starts over.
+* ``run_concurrently``: runs the calls in a thread pool with a bounded number
+  of requests in flight and yields the results in the calling thread, where
+  they can be written to the database or to a CSV file as they arrive.
+* ``DescriptionGenerator``: the chat completion that rewrites a movie
+  description, shared by the two description jobs (rate-limited, retried
+  and cached in ``cache.api_cache``), with ``add_description_arguments``
+  for their common command-line options.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+import requests
+
+from .cache import api_cache
+
+DESCRIPTION_INSTRUCTION = (
+    "Vas a actuar como un aficionado del cine que sabe describir de forma clara, "
+    "concisa y precisa cualquier película en menos de 200 palabras. La descripción "
+    "debe incluir el género de la película y cualquier información adicional que sirva "
+    "para crear un sistema de recomendación."
+)
+
+
+def description_prompt(movie):
+    return (
+        f"{DESCRIPTION_INSTRUCTION} "
+        f"Vas a actualizar la descripción '{movie.description}' de la película '{movie.title}'."
+    )
+
+
+def estimate_tokens(text, max_output_tokens=0):
+    """Rough token count (~4 characters per token) used to charge the token bucket."""
+    return len(text) // 4 + 1 + max_output_tokens
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self._lock = threading.Lock()
+        # [capacidad, recarga por segundo, nivel actual]; None = sin límite
+        self._buckets = {
+            name: [limit, limit / 60.0, float(limit)]
+            for name, limit in (('requests', requests_per_minute), ('tokens', tokens_per_minute))
+            if limit
+        }
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        for bucket in self._buckets.values():
+            bucket[2] = min(bucket[0], bucket[2] + elapsed * bucket[1])
+
+    def acquire(self, tokens=0):
+        """Block until one request costing ``tokens`` tokens fits in the limits."""
+        cost = {'requests': 1, 'tokens': tokens}
+        while True:
+            with self._lock:
+                self._refill()
+                needed = {name: min(cost[name], bucket[0]) for name, bucket in self._buckets.items()}
+                waits = [(needed[name] - bucket[2]) / bucket[1]
+                         for name, bucket in self._buckets.items() if bucket[2] < needed[name]]
+                if not waits:
+                    for name, bucket in self._buckets.items():
+                        bucket[2] -= needed[name]
+                    return
+                delay = max(waits)
+            time.sleep(delay)
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    # Descargas con requests (pósters): conexión, timeout, 429 y 5xx
+    if isinstance(error, requests.HTTPError):
+        status = getattr(error.response, 'status_code', 0)
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+def retry_after(error):
+    """Seconds requested by the server's ``Retry-After`` header, if any."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def call_with_retries(call, max_retries=5, base_delay=1.0, max_delay=60.0):
+    """Run ``call()``, retrying transient API errors with exponential backoff and full jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = retry_after(e) or random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            time.sleep(delay)
+
+
+class Checkpoint:
+    """Keys already processed by a job, persisted one JSON line per key."""
+
+    def __init__(self, path, restart=False):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self.done = set()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if restart and os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['key'])
+                    except (ValueError, KeyError):
+                        continue  # última línea incompleta si el proceso se interrumpió
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark(self, keys):
+        """Record ``keys`` as done; flushed to disk before returning."""
+        with self._lock:
+            for key in keys:
+                self.done.add(key)
+                self._file.write(json.dumps({'key': key}) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def finish(self):
+        """Close and delete the checkpoint: the run completed and the next one starts from scratch."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_concurrently(items, work, workers=8):
+    """
+    Yield ``(item, result, error)`` for every item as soon as ``work(item)``
+    finishes, with at most ``2 * workers`` items submitted at a time so
+    memory stays bounded for any catalog size.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        while True:
+            for item in items:
+                pending[executor.submit(work, item)] = item
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+
+
+def add_description_arguments(parser):
+    """Command-line options shared by the jobs that use ``DescriptionGenerator``."""
+    parser.add_argument('--model', type=str, default='gpt-3.5-turbo', help='Chat completion model')
+    parser.add_argument('--workers', type=int, default=8, help='Maximum number of concurrent API requests')
+    parser.add_argument('--rpm', type=int, default=500, help='Requests per minute allowed by the account')
+    parser.add_argument('--tpm', type=int, default=200000, help='Tokens per minute allowed by the account')
+    parser.add_argument('--max-tokens', type=int, default=400, help='Maximum tokens per generated description')
+    parser.add_argument('--retries', type=int, default=5, help='Retries on 429/5xx/timeouts')
+    parser.add_argument('--cache-only', action='store_true',
+                        help='Only use cached API responses; movies without one are reported as failed')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and process every movie')
+
+
+class DescriptionGenerator:
+    """
+    ``generator(movie)`` returns the updated description of ``movie``. Safe
+    to call from several worker threads: they share the client (and its
+    connection pool) and the rate limiter.
+    """
+
+    def __init__(self, model='gpt-3.5-turbo', max_tokens=400, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, cache_only=False):
+        from openai import OpenAI
+
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.cache_only = cache_only
+        # Los reintentos los hace call_with_retries (con el limitador), no el cliente; con
+        # cache_only no se llama a la API y no hace falta la clave
+        self.client = None if cache_only else OpenAI(api_key=os.environ.get('openai_apikey'), max_retries=0,
+                                                     timeout=60)
+        self.limiter = RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(model=options['model'], max_tokens=options['max_tokens'], requests_per_minute=options['rpm'],
+                   tokens_per_minute=options['tpm'], max_retries=options['retries'],
+                   cache_only=options['cache_only'])
+
+    def __call__(self, movie):
+        prompt = description_prompt(movie)
+        request = {
+            'model': self.model,
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': 0,  # Sin creatividad: respuesta determinista
+            'max_tokens': self.max_tokens,
+        }
+
+        def create():
+            # Cada intento, también los reintentos, pasa por el limitador (igual que en update_images)
+            self.limiter.acquire(estimate_tokens(prompt, self.max_tokens))
+            return self.client.chat.completions.create(**request)
+
+        def call_api():
+            response = call_with_retries(create, max_retries=self.max_retries)
+            return response.choices[0].message.content
+
+        # Las respuestas ya obtenidas se leen de la caché, sin llamar a la API
+        return api_cache.text('chat.completions', request, call_api, cache_only=self.cache_only).strip()
@@ -0,0 +1,141 @@
+"""
+Resized WebP/JPEG variants of the movie posters.
+
+For a poster ``movie/images/m_Title.png`` the variants are written next to it,
+in ``movie/images/variants/m_Title-<width>.<webp|jpg>``, at every width of
+``settings.MOVIE_POSTER_WIDTHS`` smaller than the original plus one at the
+original width capped at the largest configured width (posters are never
+upscaled, and larger originals are not copied at full size). They are produced by
+``python manage.py generate_poster_variants`` (process pool), after each
+download in ``update_images`` and when a movie is saved; files newer than
+their poster are not rendered again.
+
+``render_variants`` only uses Pillow and plain paths, so it can run in worker
+processes without Django. The ``{% poster %}`` template tag (see
+``templatetags/posters.py``) builds the ``srcset`` from ``variant_index``,
+which lists each variants folder once and only lists it again when the folder
+changes.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image
+
+VARIANTS_DIR = 'variants'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+@contextmanager
+def atomic_write(path):
+    """Binary file written under a temporary name and renamed to ``path`` only if the block succeeds."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def variant_name(name, width, image_format):
+    """Storage name of the ``width`` pixels wide ``image_format`` variant of the poster ``name``."""
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, VARIANTS_DIR, f"{stem}-{width}.{EXTENSIONS[image_format]}")
+
+
+def target_widths(source_width, widths):
+    """The configured ``widths`` below ``source_width``, plus ``min(source_width, max(widths))``."""
+    return sorted({width for width in widths if width < source_width} | {min(source_width, max(widths))})
+
+
+def render_variants(source_path, widths, formats, quality=80, force=False):
+    """
+    Write the variants of the image at ``source_path`` that are missing or
+    older than it. Returns the number of files written.
+    """
+    folder, filename = os.path.split(source_path)
+    os.makedirs(os.path.join(folder, VARIANTS_DIR), exist_ok=True)
+    source_mtime = os.path.getmtime(source_path)
+    written = 0
+    with Image.open(source_path) as image:
+        source_width, source_height = image.size
+        for width in target_widths(source_width, widths):
+            pending = []
+            for image_format in formats:
+                path = os.path.join(folder, variant_name(filename, width, image_format))
+                if force or not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                    pending.append((image_format, path))
+            if not pending:
+                continue
+            height = max(1, round(source_height * width / source_width))
+            resized = image.convert('RGBA').resize((width, height), Image.Resampling.LANCZOS)
+            for image_format, path in pending:
+                if image_format == 'jpeg':
+                    # JPEG no tiene transparencia: fondo blanco
+                    output = Image.new('RGB', resized.size, (255, 255, 255))
+                    output.paste(resized, mask=resized.getchannel('A'))
+                    options = {'quality': quality, 'optimize': True, 'progressive': True}
+                else:
+                    output = resized
+                    options = {'quality': quality, 'method': 4}
+                with atomic_write(path) as f:
+                    output.save(f, format=image_format.upper(), **options)
+                written += 1
+    return written
+
+
+def generate_variants(name, force=False):
+    """Variants of the poster stored as ``name`` (relative to MEDIA_ROOT); 0 if the file does not exist."""
+    source_path = os.path.join(settings.MEDIA_ROOT, name)
+    if not name or not os.path.isfile(source_path):
+        return 0
+    return render_variants(source_path, settings.MOVIE_POSTER_WIDTHS, settings.MOVIE_POSTER_FORMATS,
+                           quality=settings.MOVIE_POSTER_QUALITY, force=force)
+
+
+class VariantIndex:
+    """Available variants per poster, read from the variants folders and cached until they change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = {}  # carpeta -> (mtime, {stem: {formato: [(ancho, nombre)]}})
+
+    def _scan(self, folder, path):
+        variants = {}
+        formats = {extension: image_format for image_format, extension in EXTENSIONS.items()}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                base, _, extension = entry.name.rpartition('.')
+                stem, _, width = base.rpartition('-')
+                if extension not in formats or not stem or not width.isdigit():
+                    continue
+                variants.setdefault(stem, {}).setdefault(formats[extension], []).append(
+                    (int(width), os.path.join(folder, VARIANTS_DIR, entry.name)))
+        for by_format in variants.values():
+            for entries in by_format.values():
+                entries.sort()
+        return variants
+
+    def get(self, name):
+        """``{format: [(width, variant name), ...]}`` for the poster ``name``, smallest first."""
+        folder, filename = os.path.split(name)
+        path = os.path.join(settings.MEDIA_ROOT, folder, VARIANTS_DIR)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._folders.get(folder)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, self._scan(folder, path))
+            with self._lock:
+                self._folders[folder] = cached
+        return cached[1].get(os.path.splitext(filename)[0], {})
+
+
+variant_index = VariantIndex()
@@ -0,0 +1,149 @@
+"""
+Embedding providers, chosen with ``settings.MOVIE_EMBEDDING_BACKEND``.
+
+* ``'openai'``: the OpenAI embeddings API (``text-embedding-3-small`` by
+  default). Needs the network and an API key.
+* ``'hashing'``: a local CPU encoder. Words, word bigrams and character
+  trigrams are hashed into ``MOVIE_HASHING_DIM`` signed buckets with
+  sublinear term frequencies, then L2-normalized. A whole batch is encoded
+  with one ``np.add.at``, so a prompt is embedded in microseconds without any
+  network round trip. It only captures lexical overlap, not meaning.
+
+Each provider has a ``key`` that is stored in ``Movie.emb_backend`` and mixed
+into ``Movie.emb_hash`` and the prompt cache. The index only loads the
+vectors produced by the active provider, so vectors from different backends
+are never compared.
+"""
+import asyncio
+import os
+import threading
+import weakref
+import zlib
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .embeddings import EMBEDDING_DTYPE, normalize
+from .lexical import tokenize
+
+
+class EmbeddingProvider:
+    """Base class: ``embed(texts)`` returns one L2-normalized float32 row per text."""
+    key = None
+    # Los proveedores remotos se guardan en la caché de prompts (ver cache.py)
+    remote = False
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    async def aembed(self, texts):
+        return await sync_to_async(self.embed, thread_sensitive=False)(texts)
+
+
+class OpenAIProvider(EmbeddingProvider):
+    remote = True
+
+    def __init__(self, model='text-embedding-3-small', timeout=None):
+        self.model = model
+        self.timeout = timeout
+        # Mismo valor que se usaba antes de existir los proveedores, así emb_hash sigue siendo válido
+        self.key = model
+        # Un cliente por proceso (y uno asíncrono por event loop): las conexiones HTTP se reutilizan
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _api_key():
+        api_key = os.environ.get('openai_apikey')
+        if not api_key:
+            raise ValueError("No se encontró la clave de API de OpenAI en las variables de entorno")
+        return api_key
+
+    @staticmethod
+    def _to_matrix(response):
+        # The API returns one item per input; `index` keeps the original order
+        data = sorted(response.data, key=lambda item: item.index)
+        return normalize(np.array([item.embedding for item in data], dtype=EMBEDDING_DTYPE))
+
+    def client(self):
+        from openai import OpenAI
+
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(api_key=self._api_key(), timeout=self.timeout)
+            return self._client
+
+    def async_client(self):
+        # El pool de conexiones de httpx pertenece al event loop que lo creó
+        from openai import AsyncOpenAI
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = AsyncOpenAI(api_key=self._api_key(), timeout=self.timeout)
+            return client
+
+    def embed(self, texts):
+        return self._to_matrix(self.client().embeddings.create(input=list(texts), model=self.model))
+
+    async def aembed(self, texts):
+        response = await asyncio.wait_for(
+            self.async_client().embeddings.create(input=list(texts), model=self.model),
+            timeout=self.timeout,
+        )
+        return self._to_matrix(response)
+
+
+class HashingProvider(EmbeddingProvider):
+
+    VERSION = 1
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.key = f'hashing-v{self.VERSION}-{dim}'
+
+    @staticmethod
+    def features(text):
+        """Words, word bigrams and character trigrams of ``text`` (accents and case removed)."""
+        words = tokenize(text)
+        features = list(words)
+        features += [f'{a} {b}' for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f'<{word}>'
+            features += ['#' + padded[i:i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, texts):
+        rows = []
+        hashes = []
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(zlib.crc32(feature.encode('utf-8')) for feature in features)
+        hashes = np.array(hashes, dtype=np.uint32)
+        # El bit más alto decide el signo, así las colisiones tienden a cancelarse
+        signs = np.where(hashes >> 31, 1.0, -1.0).astype(EMBEDDING_DTYPE)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=EMBEDDING_DTYPE)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), hashes % self.dim), signs)
+        return normalize(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+
+_providers = {}
+
+
+def get_provider(backend=None):
+    """Provider for ``backend`` (default ``settings.MOVIE_EMBEDDING_BACKEND``), created once per process."""
+    backend = backend or settings.MOVIE_EMBEDDING_BACKEND
+    if backend not in _providers:
+        if backend == 'openai':
+            _providers[backend] = OpenAIProvider(settings.MOVIE_OPENAI_EMBEDDING_MODEL,
+                                                 timeout=settings.MOVIE_EMBEDDING_TIMEOUT)
+        elif backend == 'hashing':
+            _providers[backend] = HashingProvider(settings.MOVIE_HASHING_DIM)
+        else:
+            raise ValueError(f"Unknown embedding backend {backend!r}, use 'openai' or 'hashing'")
+    return _providers[backend]
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import catalog, fts
+from .ann import ann_index
+from .charts import chart_cache
+from .embeddings import from_blob
+from .index import embedding_index
+from .lexical import lexical_index
+from .models import Movie
+from .posters import generate_variants
+from .providers import get_provider
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_embedding_index(sender, **kwargs):
+    # El índice se reconstruye en la siguiente consulta
+    embedding_index.invalidate()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def touch_catalog_stamp(sender, **kwargs):
+    # Los demás procesos reconstruyen sus índices al ver el cambio (ver catalog.py); solo
+    # después del commit, o podrían reconstruirlos con las filas anteriores
+    transaction.on_commit(catalog.touch)
+
+
+@receiver(post_save, sender=Movie)
+def update_ann_index(sender, instance, **kwargs):
+    # Solo los vectores del proveedor activo están en el índice
+    if instance.emb and instance.emb_backend == get_provider().key:
+        ann_index.upsert(instance.id, from_blob(instance.emb))
+
+
+@receiver(post_delete, sender=Movie)
+def remove_from_ann_index(sender, instance, **kwargs):
+    ann_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Movie)
+def update_lexical_index(sender, instance, **kwargs):
+    lexical_index.upsert(instance)
+
+
+@receiver(post_delete, sender=Movie)
+def remove_from_lexical_index(sender, instance, **kwargs):
+    lexical_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_statistics(sender, **kwargs):
+    chart_cache.invalidate()
+
+
+@receiver(post_save, sender=Movie)
+def update_poster_variants(sender, instance, update_fields=None, **kwargs):
+    # Las variantes al día no se vuelven a generar; un error no debe impedir guardar la película
+    if not settings.MOVIE_POSTER_VARIANTS_ON_SAVE or not instance.image:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    name = instance.image.name
+    transaction.on_commit(lambda: generate_variants(name), robust=True)
+
+
+@receiver(post_migrate)
+def restore_fts_triggers(sender, using='default', **kwargs):
+    # Las migraciones que reconstruyen movie_movie en SQLite eliminan sus triggers
+    if sender.name == 'movie':
+        fts.ensure_triggers(using)
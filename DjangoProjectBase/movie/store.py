@@ -0,0 +1,105 @@
+"""
+Read-only embedding store shared by every worker process.
+
+``export_store`` writes the embedding matrix and the matching movie ids as
+``.npy`` files (whose data section is 64-byte aligned) and then atomically
+replaces ``manifest.json`` to point at them. ``open_store`` maps the files
+with ``np.load(mmap_mode='r')``, so all gunicorn/uvicorn workers share the
+same page-cache pages instead of each decoding its own copy of the catalog.
+
+Old versions are removed after a swap; workers that still have them mapped
+keep reading them until they notice the new manifest.
+"""
+import json
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+
+MANIFEST_NAME = 'manifest.json'
+KEEP_VERSIONS = 2
+
+
+def store_dir():
+    return str(settings.MOVIE_EMBEDDING_STORE_DIR)
+
+
+def manifest_path(directory=None):
+    return os.path.join(directory or store_dir(), MANIFEST_NAME)
+
+
+def manifest_mtime(directory=None):
+    """Modification time of the manifest, or ``None`` if nothing has been exported."""
+    try:
+        return os.stat(manifest_path(directory)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _write_npy(path, array):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_store(ids, matrix, directory=None):
+    """Write a new version of the store and atomically make it the current one."""
+    directory = directory or store_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    version = str(time.time_ns())
+    embeddings_name = f'embeddings-{version}.npy'
+    ids_name = f'ids-{version}.npy'
+    _write_npy(os.path.join(directory, embeddings_name), np.ascontiguousarray(matrix, dtype=np.float32))
+    _write_npy(os.path.join(directory, ids_name), np.asarray(ids, dtype=np.int64))
+
+    manifest = {
+        'version': version,
+        'count': int(len(ids)),
+        'dim': int(matrix.shape[1]) if len(ids) else 0,
+        'embeddings': embeddings_name,
+        'ids': ids_name,
+    }
+    tmp_path = manifest_path(directory) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path(directory))
+
+    _remove_old_versions(directory)
+    return manifest
+
+
+def _remove_old_versions(directory):
+    versions = sorted(
+        name[len('embeddings-'):-len('.npy')]
+        for name in os.listdir(directory)
+        if name.startswith('embeddings-') and name.endswith('.npy')
+    )
+    for version in versions[:-KEEP_VERSIONS]:
+        for prefix in ('embeddings', 'ids'):
+            try:
+                os.remove(os.path.join(directory, f'{prefix}-{version}.npy'))
+            except FileNotFoundError:
+                pass
+
+
+def open_store(directory=None):
+    """
+    Return ``(ids, matrix)`` memory-mapped read-only from the current
+    version of the store, or ``None`` if it has not been exported yet.
+    """
+    directory = directory or store_dir()
+    try:
+        with open(manifest_path(directory)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not manifest['count']:
+        return np.empty(0, dtype=np.int64), np.empty((0, manifest['dim']), dtype=np.float32)
+    ids = np.load(os.path.join(directory, manifest['ids']), mmap_mode='r')
+    matrix = np.load(os.path.join(directory, manifest['embeddings']), mmap_mode='r')
+    return ids, matrix
@@ -0,0 +1,47 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from movie.posters import variant_index
+
+register = template.Library()
+
+# Ancho de cada tarjeta en las cuadrículas de películas (tres columnas desde md)
+DEFAULT_SIZES = '(min-width: 768px) 33vw, 100vw'
+
+
+def _srcset(variants):
+    return ', '.join(f"{default_storage.url(name)} {width}w" for width, name in variants)
+
+
+@register.simple_tag
+def poster(movie, css_class='card-img-top', sizes=DEFAULT_SIZES):
+    """
+    ``<img>`` of the poster of ``movie`` with lazy loading, wrapped in a
+    ``<picture>`` with the WebP and JPEG variants (``srcset``) when they exist.
+
+        {% load posters %}
+        {% poster movie css_class="card-img-top" %}
+    """
+    if not movie.image:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+                           static('images/default.jpg'), css_class, movie.title)
+
+    variants = variant_index.get(movie.image.name)
+    if not variants:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+                           movie.image.url, css_class, movie.title)
+
+    # El navegador elige el formato (WebP si lo soporta) y el ancho según `sizes`
+    source = ''
+    if 'webp' in variants:
+        source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', _srcset(variants['webp']), sizes)
+    fallback = variants.get('jpeg')
+    if fallback:
+        img = format_html('<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+                          default_storage.url(fallback[-1][1]), _srcset(fallback), sizes, css_class, movie.title)
+    else:
+        img = format_html('<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+                          movie.image.url, css_class, movie.title)
+    return format_html('<picture>{}{}</picture>', source, img)
@@ -1,3 +1,928 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import catalog, charts, fts, pipeline, store, views
+from .ann import AnnIndex, IVFIndex
+from .cache import APICache, CacheMiss, LRUCache, PromptEmbeddingCache, SQLiteCache
+from .compression import PCAReducer, ReducedMatrix, load_pca
+from .embeddings import NORMALIZED, normalize, to_blob, top_k
+from .index import embedding_index
+from .jsonstream import iter_json_array
+from .lexical import lexical_index
+from .models import Genre, Movie, MovieNeighbor
+from .pipeline import Checkpoint, DescriptionGenerator, RateLimiter, call_with_retries
+from .posters import VariantIndex, render_variants, target_widths
+from .providers import get_provider
+
+
+def temporary_data_dir(test):
+    """Test settings with the files the signals and indexes write (catalog stamp, ANN index, PCA projection) in a temporary folder."""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    overrides = override_settings(
+        MOVIE_EMBEDDING_BACKEND='hashing',
+        MOVIE_SEARCH_BACKEND='exact',
+        MOVIE_EMBEDDING_SOURCE='database',
+        MOVIE_CATALOG_STAMP_PATH=os.path.join(tmp.name, 'catalog.stamp'),
+        MOVIE_CATALOG_CHECK_INTERVAL=0,
+        MOVIE_ANN_INDEX_PATH=os.path.join(tmp.name, 'ann_index.npz'),
+        MOVIE_PCA_PATH=os.path.join(tmp.name, 'pca.npz'),
+        MOVIE_POSTER_VARIANTS_ON_SAVE=False,
+    )
+    overrides.enable()
+    test.addCleanup(overrides.disable)
+
+
+class IterJsonArrayTests(SimpleTestCase):
+
+    def parse(self, text, chunk_size):
+        return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_every_chunk_boundary(self):
+        # Cada tamaño de bloque corta los elementos en un punto distinto
+        texts = [
+            '[1.5]',
+            '[ 123 , -4e10,1.25e-3 ]',
+            '[true, false, null, "a,]b", {"x": [1, 2]}, 7]',
+            '[{"title": "Alien", "genre": "Horror, Sci-Fi", "year": 1979}, {"title": "Heat"}]',
+            '[]',
+            ' [\n] ',
+        ]
+        for text in texts:
+            for chunk_size in range(1, len(text) + 2):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    self.assertEqual(self.parse(text, chunk_size), json.loads(text))
+
+    def test_invalid_input(self):
+        for text in ['{}', '[1', '[1 2]', '[1.]', '[{"a": 1}', '[,1]', '[1,,2]', '[1, ,2]', '[1,]', '[,]', '[1,']:
+            for chunk_size in (1, 3, 1 << 16):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        self.parse(text, chunk_size)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module in ``pipeline``: ``sleep`` advances ``monotonic`` instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class PipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(pipeline, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate_limiter_requests_per_minute(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        for _ in range(60):
+            limiter.acquire()
+        self.assertEqual(self.clock.now, 0)
+        # El cubo está vacío: una petición más espera a que se recargue (1 por segundo)
+        limiter.acquire()
+        self.assertAlmostEqual(self.clock.now, 1.0, places=6)
+
+    def test_rate_limiter_tokens_per_minute(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.acquire(300)
+        limiter.acquire(300)
+        self.assertEqual(self.clock.now, 0)
+        limiter.acquire(300)
+        self.assertAlmostEqual(self.clock.now, 30.0, places=6)
+        # Una petición más cara que la capacidad no bloquea para siempre
+        limiter.acquire(10000)
+        self.assertAlmostEqual(self.clock.now, 90.0, places=6)
+
+    def test_call_with_retries_transient_errors(self):
+        response = requests.Response()
+        response.status_code = 503
+        response.headers['Retry-After'] = '7'
+        errors = [requests.ConnectionError(), requests.HTTPError(response=response)]
+
+        def call():
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+
+        self.assertEqual(call_with_retries(call, max_retries=2), 'ok')
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertLessEqual(self.clock.sleeps[0], 1.0)  # primer reintento: jitter en [0, base_delay]
+        self.assertEqual(self.clock.sleeps[1], 7.0)      # Retry-After del servidor
+
+    def test_call_with_retries_gives_up(self):
+        call = mock.Mock(side_effect=requests.Timeout())
+        with self.assertRaises(requests.Timeout):
+            call_with_retries(call, max_retries=3)
+        self.assertEqual(call.call_count, 4)
+
+        # Los errores que no son transitorios no se reintentan
+        call = mock.Mock(side_effect=ValueError('bad request'))
+        with self.assertRaises(ValueError):
+            call_with_retries(call, max_retries=3)
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(len(self.clock.sleeps), 3)
+
+    def test_description_generator_rate_limits_every_attempt(self):
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=' New description '))])
+        with mock.patch('openai.OpenAI') as client_class, mock.patch.object(pipeline, 'api_cache') as cache:
+            cache.text.side_effect = lambda endpoint, request, compute, cache_only: compute()
+            client_class.return_value.chat.completions.create.side_effect = [requests.ConnectionError(), response]
+            generate = DescriptionGenerator(requests_per_minute=60, max_retries=2)
+            with mock.patch.object(generate.limiter, 'acquire', wraps=generate.limiter.acquire) as acquire:
+                movie = SimpleNamespace(title='Alien', description='Old description')
+                self.assertEqual(generate(movie), 'New description')
+        self.assertEqual(acquire.call_count, 2)
+
+    def test_checkpoint_resume_restart_and_finish(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'checkpoints', 'job.jsonl')
+            checkpoint = Checkpoint(path)
+            checkpoint.mark([1, 2])
+            checkpoint.mark([3])
+            checkpoint.close()
+            # Línea incompleta de un proceso interrumpido
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('{"ke')
+
+            checkpoint = Checkpoint(path)
+            self.assertEqual(checkpoint.done, {1, 2, 3})
+            self.assertIn(2, checkpoint)
+            self.assertNotIn(4, checkpoint)
+            checkpoint.close()
+
+            checkpoint = Checkpoint(path, restart=True)
+            self.assertEqual(checkpoint.done, set())
+            checkpoint.mark([5])
+            checkpoint.finish()
+            self.assertFalse(os.path.exists(path))
+            checkpoint = Checkpoint(path)
+            self.assertEqual(checkpoint.done, set())
+            checkpoint.close()
+
+
+class IVFIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def random_vectors(self, n, dim=16):
+        return normalize(self.rng.standard_normal((n, dim)).astype(np.float32))
+
+    def assertMatchesBruteForce(self, index, live, k=10):
+        ids = np.array(sorted(live), dtype=np.int64)
+        matrix = np.array([live[movie_id] for movie_id in ids], dtype=np.float32)
+        for query in self.random_vectors(5):
+            scores = matrix @ query
+            top = top_k(scores, k)
+            results = index.search(query, k=k)
+            self.assertEqual([movie_id for movie_id, _ in results], ids[top].tolist())
+            for (_, score), expected_score in zip(results, scores[top]):
+                self.assertAlmostEqual(score, float(expected_score), places=5)
+
+    def test_add_remove_and_compaction(self):
+        vectors = self.random_vectors(400)
+        live = dict(enumerate(vectors))
+        # nprobe = nlist: se recorren todas las celdas, la búsqueda es exacta
+        index = IVFIndex.build(list(live), vectors, nlist=8, nprobe=8)
+        self.assertMatchesBruteForce(index, live)
+
+        # Nuevos ids y vectores nuevos para ids existentes (sin reentrenar los centroides)
+        new_vectors = self.random_vectors(60)
+        new_ids = list(range(400, 430)) + list(range(0, 30))
+        index.add(new_ids, new_vectors)
+        live.update(zip(new_ids, new_vectors))
+        self.assertEqual(len(index), len(live))
+        self.assertMatchesBruteForce(index, live)
+
+        removed = list(range(30, 250))
+        index.remove(removed)
+        for movie_id in removed:
+            del live[movie_id]
+        # Más de un 25 % de filas borradas: el índice se compacta
+        self.assertEqual(len(index), len(live))
+        self.assertEqual(len(index.ids), len(live))
+        self.assertTrue((index.ids >= 0).all())
+        self.assertMatchesBruteForce(index, live)
+
+        index.add([1000], self.random_vectors(1))
+        live[1000] = index.vectors[-1]
+        self.assertMatchesBruteForce(index, live)
+
+    def test_save_and_load(self):
+        vectors = self.random_vectors(200)
+        index = IVFIndex.build(np.arange(200), vectors, nlist=4, nprobe=4, backend='hashing-v1-16')
+        index.remove(list(range(10)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ann_index.npz')
+            index.save(path)
+            loaded = IVFIndex.load(path)
+        self.assertEqual(loaded.backend, 'hashing-v1-16')
+        self.assertEqual(len(loaded), 190)
+        self.assertMatchesBruteForce(loaded, dict(zip(range(10, 200), vectors[10:])))
+
+    def test_copy_leaves_the_original_unchanged(self):
+        vectors = self.random_vectors(300)
+        index = IVFIndex.build(np.arange(300), vectors, nlist=4, nprobe=4)
+        live = dict(enumerate(vectors))
+
+        copy = index.copy()
+        copy.add([0, 500], self.random_vectors(2))
+        copy.remove(list(range(1, 200)))  # compacta la copia
+        self.assertEqual(len(copy), 102)
+        self.assertMatchesBruteForce(index, live)
+
+        # El original reserva memoria nueva al crecer: no pisa las filas que añadió la copia
+        copy_live = {movie_id: copy.vectors[copy._row_of[movie_id]] for movie_id in copy._row_of}
+        index.add([700], self.random_vectors(1))
+        self.assertMatchesBruteForce(copy, copy_live)
+        live[700] = index.vectors[index._row_of[700]]
+        self.assertMatchesBruteForce(index, live)
+
+    def test_ann_index_updates_replace_the_index(self):
+        vectors = self.random_vectors(100)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ann_index.npz')
+            IVFIndex.build(np.arange(100), vectors, nlist=4, nprobe=4).save(path)
+            with override_settings(MOVIE_ANN_INDEX_PATH=path, MOVIE_ANN_NPROBE=4,
+                                   MOVIE_EMBEDDING_BACKEND='hashing'):
+                ann = AnnIndex()
+                before = ann.get()
+                ann.upsert(100, self.random_vectors(1)[0])
+                ann.remove(5)
+                after = ann.get()
+        # Una búsqueda que ya tenía el índice anterior no ve los cambios
+        self.assertIsNot(after, before)
+        self.assertEqual(len(before), 100)
+        self.assertIn(5, before._row_of)
+        self.assertEqual(len(after), 100)
+        self.assertIn(100, after._row_of)
+        self.assertNotIn(5, after._row_of)
+
+
+class PCATests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.path = settings.MOVIE_PCA_PATH
+        self.provider = get_provider()
+        self.matrix = normalize(np.random.default_rng(0).standard_normal((50, 16)).astype(np.float32))
+
+    def test_save_replaces_the_file_atomically(self):
+        PCAReducer.fit(self.matrix, 4).save(self.path)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['pca.npz'])
+        self.assertEqual(load_pca(self.path, 16, 4).dim, 4)
+
+    def test_truncated_file_falls_back_to_exact_search(self):
+        PCAReducer.fit(self.matrix, 4).save(self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) // 2)
+        with self.assertLogs('movie.compression', 'WARNING'):
+            self.assertIsNone(load_pca(self.path, 16, 4))
+
+    @override_settings(MOVIE_INDEX_REDUCED_DIM=2, MOVIE_INDEX_REDUCTION='pca')
+    def test_embedding_index_reloads_a_new_projection(self):
+        vectors = self.provider.embed(['space ship', 'crime city', 'family comedy'])
+        Movie.objects.bulk_create([
+            Movie(title=f'Movie {i}', description='', emb=to_blob(vector), emb_version=NORMALIZED,
+                  emb_backend=self.provider.key)
+            for i, vector in enumerate(vectors)
+        ])
+        catalog.touch()
+        with self.assertLogs('movie.compression', 'WARNING'):
+            self.assertIsNone(embedding_index.data().tier)
+        call_command('fit_pca', dim=2, stdout=io.StringIO())
+        self.assertIsInstance(embedding_index.data().tier, ReducedMatrix)
+
+
+class MovieNeighborsTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.rng = np.random.default_rng(1)
+        self.key = get_provider().key
+
+    def create_movies(self, count):
+        start = Movie.objects.count()
+        return Movie.objects.bulk_create([
+            Movie(title=f'Movie {start + i}', description='', emb=to_blob(vector),
+                  emb_version=NORMALIZED, emb_backend=self.key)
+            for i, vector in enumerate(normalize(self.rng.standard_normal((count, 32))))
+        ])
+
+    def run_command(self, **options):
+        out = io.StringIO()
+        call_command('movie_neighbors', k=5, block_size=7, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def stored_lists(self):
+        lists = {}
+        for movie_id, neighbor_id, score in MovieNeighbor.objects.values_list('movie_id', 'neighbor_id', 'score'):
+            lists.setdefault(movie_id, []).append((neighbor_id, score))
+        return lists
+
+    def assertSameLists(self, lists, expected):
+        self.assertEqual(set(lists), set(expected))
+        for movie_id, items in expected.items():
+            self.assertEqual([n for n, _ in lists[movie_id]], [n for n, _ in items], movie_id)
+            for (_, score), (_, expected_score) in zip(lists[movie_id], items):
+                self.assertAlmostEqual(score, expected_score, places=5)
+
+    def test_incremental_update_matches_full_recompute(self):
+        movies = self.create_movies(40)
+        self.run_command()
+        self.assertIn('up to date', self.run_command())
+
+        # Embeddings nuevos, una película borrada y dos nuevas
+        for movie, vector in zip(movies[:3], normalize(self.rng.standard_normal((3, 32)))):
+            movie.emb = to_blob(vector)
+        Movie.objects.bulk_update(movies[:3], ['emb'])
+        movies[10].delete()
+        self.create_movies(2)
+
+        output = self.run_command()
+        self.assertNotIn('41 of 41', output)
+        incremental = self.stored_lists()
+        self.assertEqual(len(incremental), 41)
+
+        self.run_command(full=True)
+        self.assertSameLists(incremental, self.stored_lists())
+
+    def test_queries_do_not_grow_with_the_catalog(self):
+        # Las listas IN van por bloques (--block-size=7): ninguna consulta lleva todo el catálogo
+        self.create_movies(40)
+        params = []
+
+        def record(execute, sql, parameters, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                params.append(len(parameters or ()))
+            return execute(sql, parameters, many, context)
+
+        with connection.execute_wrapper(record):
+            self.run_command()
+            movies = list(Movie.objects.order_by('id')[:3])
+            for movie in movies:
+                movie.emb = to_blob(normalize(self.rng.standard_normal(32)))
+            Movie.objects.bulk_update(movies, ['emb'])
+            self.run_command()
+        self.assertLessEqual(max(params), 7)
+
+
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.provider = get_provider()
+
+    def test_touch_changes_the_fingerprint_whatever_the_mtime(self):
+        catalog.touch()
+        path = catalog.stamp_path()
+        mtime = os.stat(path).st_mtime_ns
+        before = catalog.version()
+        catalog.touch()
+        os.utime(path, ns=(mtime, mtime))  # sistema de archivos con resolución de tiempo gruesa
+        self.assertNotEqual(catalog.version(), before)
+
+    def test_saves_touch_the_stamp_after_commit(self):
+        token = catalog.stamp_token()
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = Movie.objects.create(title='Alien', description='', genre='Horror')
+            movie.year = 1979
+            movie.save()
+            self.assertEqual(catalog.stamp_token(), token)
+        self.assertNotEqual(catalog.stamp_token(), token)
+
+    def test_embedding_index_sees_bulk_writes(self):
+        space, crime = self.provider.embed(['space ship', 'crime city'])
+        alien, heat = Movie.objects.bulk_create([
+            Movie(title=title, description='', emb=to_blob(vector), emb_version=NORMALIZED,
+                  emb_backend=self.provider.key)
+            for title, vector in (('Alien', space), ('Heat', crime))
+        ])
+        catalog.touch()
+        self.assertEqual(embedding_index.search(crime)[0][0], heat.id)
+
+        # Mismo número de películas, mismo id máximo y mismo emb_version: solo cambia el token
+        alien.emb, heat.emb = to_blob(crime), to_blob(space)
+        Movie.objects.bulk_update([alien, heat], ['emb'])
+        catalog.touch()
+        self.assertEqual(embedding_index.search(crime)[0][0], alien.id)
+
+
+class PromptCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'prompt_cache.sqlite3')
+        overrides = override_settings(MOVIE_PROMPT_CACHE_PATH=self.path, MOVIE_PROMPT_CACHE_SIZE=2,
+                                      MOVIE_PROMPT_CACHE_TTL=60, MOVIE_PROMPT_CACHE_MAX_ENTRIES=3)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.vector = np.arange(4, dtype=np.float32)
+
+    def test_normalized_prompts_share_an_entry_per_model(self):
+        cache = PromptEmbeddingCache()
+        compute = mock.Mock(return_value=self.vector)
+        cache.get_or_compute('Película  de  GUERRA', 'model-a', compute)
+        np.testing.assert_array_equal(cache.get_or_compute('película de guerra', 'model-a', compute), self.vector)
+        self.assertEqual(compute.call_count, 1)
+        self.assertIsNone(cache.get('película de guerra', 'model-b'))
+
+    def test_disk_tier_survives_a_restart(self):
+        PromptEmbeddingCache().set('space', 'model', self.vector)
+        cache = PromptEmbeddingCache()
+        np.testing.assert_array_equal(cache.get('space', 'model'), self.vector)
+        np.testing.assert_array_equal(cache.get('space', 'model'), self.vector)
+        self.assertEqual(cache.stats(), {'memory_hits': 1, 'disk_hits': 1, 'misses': 0, 'hit_rate': 1.0})
+
+    def test_entries_expire_and_the_oldest_are_evicted(self):
+        disk = SQLiteCache(self.path, ttl=60, max_entries=3)
+        with mock.patch('movie.cache.time.time', return_value=1000.0):
+            disk.set('old', b'1')
+        for i in range(4):
+            with mock.patch('movie.cache.time.time', return_value=2000.0 + i):
+                disk.set(f'key{i}', b'1')
+        with mock.patch('movie.cache.time.time', return_value=2010.0):
+            self.assertIsNone(disk.get('old'))
+            disk.evict()
+            self.assertEqual(len(disk), 3)
+            self.assertIsNone(disk.get('key0'))
+            self.assertEqual(disk.get('key3'), b'1')
+
+    def test_memory_tier_is_bounded(self):
+        memory = LRUCache(maxsize=2)
+        memory.set('a', 1)
+        memory.set('b', 2)
+        memory.get('a')
+        memory.set('c', 3)
+        self.assertEqual((memory.get('a'), memory.get('b'), memory.get('c')), (1, None, 3))
+
+
+class APICacheTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'api_cache.sqlite3')
+        overrides = override_settings(MOVIE_API_CACHE_PATH=self.path, MOVIE_API_CACHE_MAX_BYTES=None)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.cache = APICache()
+
+    def test_key_covers_endpoint_model_parameters_and_input(self):
+        request = {'model': 'gpt-4o-mini', 'temperature': 0, 'messages': ['hola']}
+        self.assertEqual(APICache.key('chat', request), APICache.key('chat', dict(reversed(request.items()))))
+        self.assertNotEqual(APICache.key('chat', request), APICache.key('chat', {**request, 'temperature': 1}))
+        self.assertNotEqual(APICache.key('chat', request), APICache.key('images', request))
+
+    def test_text_is_computed_once(self):
+        compute = mock.Mock(return_value='Una película')
+        request = {'model': 'gpt-4o-mini', 'prompt': 'Alien'}
+        self.assertEqual(self.cache.text('chat', request, compute), 'Una película')
+        self.assertEqual(APICache().text('chat', request, compute, cache_only=True), 'Una película')
+        self.assertEqual(compute.call_count, 1)
+        with self.assertRaises(CacheMiss):
+            self.cache.text('chat', {**request, 'prompt': 'Heat'}, compute, cache_only=True)
+
+    def test_embeddings_only_send_the_missing_texts(self):
+        compute = mock.Mock(side_effect=lambda texts: np.ones((len(texts), 4), dtype=np.float32))
+        self.cache.embeddings('model', ['a', 'b'], compute)
+        vectors = self.cache.embeddings('model', ['b', 'c', 'a'], compute)
+        self.assertEqual(vectors.shape, (3, 4))
+        self.assertEqual([call.args[0] for call in compute.call_args_list], [['a', 'b'], ['c']])
+        with self.assertRaises(CacheMiss):
+            self.cache.embeddings('model', ['a', 'd'], compute, cache_only=True)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_least_recently_used_entries_are_evicted_beyond_max_bytes(self):
+        disk = SQLiteCache(self.path, max_bytes=25)
+        for i, key in enumerate(('a', 'b', 'c')):
+            with mock.patch('movie.cache.time.time', return_value=1000.0 + i):
+                disk.set(key, b'x' * 10)
+        with mock.patch('movie.cache.time.time', return_value=1010.0):
+            disk.get('a')
+        disk.evict()
+        self.assertEqual((disk.get('a'), disk.get('b'), disk.get('c')), (b'x' * 10, None, b'x' * 10))
+
+
+class EmbeddingStoreTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_open_store_maps_the_exported_version(self):
+        self.assertIsNone(store.open_store(self.directory))
+        matrix = normalize(np.random.default_rng(0).standard_normal((5, 8)).astype(np.float32))
+        store.export_store([3, 5, 7, 9, 11], matrix, directory=self.directory)
+        ids, mapped = store.open_store(self.directory)
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertFalse(mapped.flags.writeable)
+        np.testing.assert_array_equal(ids, [3, 5, 7, 9, 11])
+        np.testing.assert_array_equal(mapped, matrix)
+
+    def test_old_versions_are_removed_but_stay_readable_while_mapped(self):
+        first = normalize(np.ones((2, 4), dtype=np.float32))
+        store.export_store([1, 2], first, directory=self.directory)
+        _, mapped = store.open_store(self.directory)
+        for _ in range(store.KEEP_VERSIONS + 1):
+            store.export_store([1, 2, 3], normalize(np.eye(3, 4, dtype=np.float32)), directory=self.directory)
+        files = [name for name in os.listdir(self.directory) if name.startswith('embeddings-')]
+        self.assertEqual(len(files), store.KEEP_VERSIONS)
+        np.testing.assert_array_equal(mapped, first)
+        self.assertEqual(len(store.open_store(self.directory)[0]), 3)
+
+    def test_embedding_index_reads_the_store(self):
+        provider = get_provider()
+        space, crime = provider.embed(['space ship', 'crime city'])
+        alien, heat = Movie.objects.bulk_create([
+            Movie(title=title, description='', emb=to_blob(vector), emb_version=NORMALIZED,
+                  emb_backend=provider.key)
+            for title, vector in (('Alien', space), ('Heat', crime))
+        ])
+        call_command('export_embeddings', dir=self.directory, stdout=io.StringIO())
+        # La base de datos cambia, pero el índice sigue al archivo exportado
+        alien.emb, heat.emb = to_blob(crime), to_blob(space)
+        Movie.objects.bulk_update([alien, heat], ['emb'])
+        catalog.touch()
+        with override_settings(MOVIE_EMBEDDING_SOURCE='store', MOVIE_EMBEDDING_STORE_DIR=self.directory):
+            self.assertEqual([movie_id for movie_id, _ in embedding_index.search(crime, k=2)], [heat.id, alien.id])
+        self.assertEqual([movie_id for movie_id, _ in embedding_index.search(crime, k=2)], [alien.id, heat.id])
+
+
+class FullTextSearchTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.schindler = Movie.objects.create(title="Schíndler's List", description='A German industrialist',
+                                              genre='Drama')
+        self.pianist = Movie.objects.create(title='The Pianist', description='Schindler appears in no scene',
+                                            genre='Drama')
+        self.space = [Movie.objects.create(title=f'Space {i}', description='Astronauts in space', genre='Sci-Fi')
+                      for i in range(5)]
+
+    def test_matches_without_accents_and_by_prefix(self):
+        self.assertEqual(fts.search('schind', limit=10), [self.schindler.id, self.pianist.id])
+        self.assertEqual(fts.search('LIST schin', limit=10), [self.schindler.id])
+        self.assertEqual(fts.search('western', limit=10), [])
+
+    def test_keyset_pages_reach_every_match_once(self):
+        pages, after = [], None
+        while True:
+            page = fts.search('space', limit=2, after=after)
+            if not page:
+                break
+            pages.append(page)
+            after = page[-1]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sorted(sum(pages, [])), [movie.id for movie in self.space])
+
+    def test_bulk_writes_and_dropped_triggers_stay_indexed(self):
+        self.pianist.title = 'El pianista'
+        Movie.objects.bulk_update([self.pianist], ['title'])
+        self.assertEqual(fts.search('pianista', limit=10), [self.pianist.id])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER movie_movie_fts_ai')
+        Movie.objects.create(title='Heat', description='Crime in Los Angeles', genre='Crime')
+        self.assertEqual(fts.ensure_triggers(), ['movie_movie_fts_ai'])
+        self.assertEqual(len(fts.search('heat', limit=10)), 1)
+
+
+class HomeListingTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.movies = [Movie.objects.create(title=f'Movie {i}', description='', genre='Drama', year=2000 + i)
+                       for i in range(5)]
+        self.alien = Movie.objects.create(title='Alien', description='Space horror', genre='Horror')
+
+    def page(self, **params):
+        response = self.client.get(reverse('home'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_keyset_cursor_walks_every_movie(self):
+        seen, after = [], None
+        while True:
+            context = self.page(page_size=4, **({'after': after} if after else {}))
+            seen += context['movies']
+            after = context['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(seen, [*self.movies, self.alien])
+
+    def test_only_the_listed_columns_are_loaded(self):
+        movie = self.page()['movies'][0]
+        self.assertIn('emb', movie.get_deferred_fields())
+        self.assertNotIn('title', movie.get_deferred_fields())
+
+    def test_search_pages_follow_the_ranking(self):
+        context = self.page(searchMovie='movie', page_size=3)
+        self.assertEqual(len(context['movies']), 3)
+        rest = self.page(searchMovie='movie', page_size=3, after=context['next_cursor'])['movies']
+        self.assertEqual(sorted(context['movies'] + rest, key=lambda movie: movie.id), self.movies)
+        self.assertEqual(self.page(searchMovie='alie')['movies'], [self.alien])
+
+
+class StatisticsCountTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        for title, genre, year in (('Alien', 'Horror, Sci-Fi', 1979), ('Aliens', 'Sci-Fi', 1986),
+                                   ('Heat', 'Crime', None), ('Ronin', '', 1986)):
+            Movie.objects.create(title=title, description='', genre=genre, year=year)
+
+    def test_counts_are_aggregated_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(charts.movie_counts_by_year(), {1979: 1, 1986: 2, 'None': 1})
+        with self.assertNumQueries(1):
+            self.assertEqual(charts.movie_counts_by_genre(), {'None': 1, 'Crime': 1, 'Horror': 1, 'Sci-Fi': 1})
+
+    def test_first_genre_follows_updates(self):
+        movie = Movie.objects.get(title='Heat')
+        movie.genre = 'Thriller, Crime'
+        movie.save(update_fields=['genre'])
+        self.assertEqual(Movie.objects.get(title='Heat').first_genre, 'Thriller')
+
+
+class ChartCacheTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        Movie.objects.create(title='Alien', description='', genre='Horror', year=1979)
+        # Cada prueba empieza con una caché vacía
+        self.cache = charts.ChartCache()
+        patcher = mock.patch.object(views, 'chart_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_charts_are_rendered_once_per_data(self):
+        with mock.patch('movie.charts.render_bar_chart', wraps=charts.render_bar_chart) as render:
+            first = self.cache.bar_chart({1979: 1}, 'Year', 'Number of movies')
+            self.assertEqual(self.cache.bar_chart({1979: 1}, 'Year', 'Number of movies'), first)
+            self.cache.bar_chart({1979: 2}, 'Year', 'Number of movies')
+        self.assertEqual(render.call_count, 2)
+        self.assertTrue(base64.b64decode(first).startswith(b'\x89PNG'))
+
+    def test_unchanged_statistics_page_runs_no_query(self):
+        self.client.get(reverse('statistics'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('statistics'))
+        self.assertTrue(response.context['year_graphic'])
+
+    def test_counts_are_recomputed_after_a_save(self):
+        # La señal post_save invalida la caché global
+        self.assertEqual(charts.chart_cache.counts('year', charts.movie_counts_by_year), {1979: 1})
+        Movie.objects.create(title='Heat', description='', genre='Crime', year=1995)
+        self.assertEqual(charts.chart_cache.counts('year', charts.movie_counts_by_year), {1979: 1, 1995: 1})
+
+
+class ImportCommandTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = tmp.name
+        self.alien = Movie.objects.create(title='Alien', description='Old description', genre='Horror')
+        self.heat = Movie.objects.create(title='Heat', description='Crime in Los Angeles', genre='Crime')
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_upserts_in_batches(self):
+        rows = ''.join(f'New {i},Description {i}\n' for i in range(20))
+        path = self.write('movies.csv', 'Title,Updated Description\n'
+                                        'Alien,Space horror\nHeat,Crime in Los Angeles\n'
+                                        'Ronin,First\nRonin,Second\n' + rows)
+        token = catalog.stamp_token()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_movies_from_csv', csv=path, batch_size=8, stdout=io.StringIO())
+        self.assertLess(len(queries), 40)
+        self.assertEqual(Movie.objects.get(id=self.alien.id).description, 'Space horror')
+        self.assertEqual(Movie.objects.get(title='Ronin').description, 'Second')
+        self.assertEqual(Movie.objects.count(), 23)
+        self.assertEqual(list(Movie.objects.get(title='New 7').genres.values_list('name', flat=True)), ['Drama'])
+        self.assertNotEqual(catalog.stamp_token(), token)
+
+    def test_csv_with_missing_columns_reports_errors(self):
+        path = self.write('movies.csv', 'Title,Description\nAlien,Space horror\n')
+        stderr = io.StringIO()
+        call_command('update_movies_from_csv', csv=path, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('missing column', stderr.getvalue())
+        self.assertEqual(Movie.objects.get(id=self.alien.id).description, 'Old description')
+
+    def test_json_import_skips_existing_and_repeated_titles(self):
+        path = self.write('movies.json', json.dumps([
+            {'title': 'Alien', 'genre': 'Horror', 'year': 1979},
+            {'title': 'Ronin', 'genre': 'Action, Thriller', 'year': 1998, 'description': 'Heist'},
+            {'title': 'Ronin', 'genre': 'Drama', 'year': 2000},
+            'not a movie',
+            {'title': 'Collateral', 'genre': 'Crime', 'year': 2004},
+            {'title': 'Up', 'genre': 'Animation', 'year': 2009},
+        ]))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('add_movies_db', file=path, batch_size=2, limit=5, stdout=stdout, stderr=stderr)
+        self.assertIn('Successfully added 2 movies to the database (2 already present, 1 errors, 5 read)',
+                      stdout.getvalue())
+        ronin = Movie.objects.get(title='Ronin')
+        self.assertEqual((ronin.year, ronin.description, ronin.first_genre), (1998, 'Heist', 'Action'))
+        self.assertEqual(sorted(ronin.genres.values_list('name', flat=True)), ['Action', 'Thriller'])
+        self.assertFalse(Movie.objects.filter(title='Up').exists())
+
+
+class GenreTests(TestCase):
+
+    def setUp(self):
+        temporary_data_dir(self)
+
+    def genres_of(self, movie):
+        return sorted(movie.genres.values_list('name', flat=True))
+
+    def test_save_syncs_the_genre_relation(self):
+        movie = Movie.objects.create(title='Alien', description='', genre='Horror, Sci-Fi')
+        self.assertEqual(movie.first_genre, 'Horror')
+        self.assertEqual(self.genres_of(movie), ['Horror', 'Sci-Fi'])
+        movie.genre = 'sci-fi, Drama'
+        movie.save(update_fields=['genre'])
+        self.assertEqual(self.genres_of(movie), ['Drama', 'Sci-Fi'])
+        self.assertEqual(Genre.objects.count(), 3)
+
+    def test_admin_change_keeps_the_synced_genres(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        movie = Movie.objects.create(title='Alien', description='Space horror', genre='Horror')
+        response = self.client.post(reverse('admin:movie_movie_change', args=[movie.id]), {
+            'title': 'Alien', 'description': 'Space horror', 'url': '', 'genre': 'Sci-Fi, Thriller',
+            'year': 1979, 'emb_version': 0, 'emb_hash': '', 'emb_backend': '', 'neighbors_hash': '',
+        })
+        self.assertRedirects(response, reverse('admin:movie_movie_changelist'))
+        movie.refresh_from_db()
+        self.assertEqual(movie.genre, 'Sci-Fi, Thriller')
+        self.assertEqual(self.genres_of(movie), ['Sci-Fi', 'Thriller'])
+
+
+class PosterVariantTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        os.makedirs(os.path.join(self.media_root, 'movie', 'images'))
+
+    def save_poster(self, name, size):
+        path = os.path.join(self.media_root, name)
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(path)
+        return path
+
+    def test_target_widths_never_upscale(self):
+        self.assertEqual(target_widths(256, (160, 320, 480)), [160, 256])
+        self.assertEqual(target_widths(1024, (160, 320, 480)), [160, 320, 480])
+        self.assertEqual(target_widths(100, (160, 320, 480)), [100])
+
+    def test_render_variants_writes_missing_files_only(self):
+        path = self.save_poster('movie/images/m_Alien.png', (256, 384))
+        self.assertEqual(render_variants(path, (160, 320), ('webp', 'jpeg')), 4)
+        self.assertEqual(render_variants(path, (160, 320), ('webp', 'jpeg')), 0)
+        with Image.open(os.path.join(self.media_root, 'movie/images/variants/m_Alien-256.jpg')) as image:
+            self.assertEqual(image.size, (256, 384))
+        self.assertEqual(render_variants(path, (160, 320), ('webp',), force=True), 2)
+
+    def test_variant_index_lists_each_poster(self):
+        path = self.save_poster('movie/images/m_Alien.png', (256, 384))
+        render_variants(path, (160, 320), ('webp',))
+        index = VariantIndex()
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(index.get('movie/images/m_Alien.png'), {'webp': [
+                (160, 'movie/images/variants/m_Alien-160.webp'),
+                (256, 'movie/images/variants/m_Alien-256.webp'),
+            ]})
+            self.assertEqual(index.get('movie/images/m_Heat.png'), {})
+            render_variants(self.save_poster('movie/images/m_Heat.png', (160, 240)), (160, 320), ('webp',))
+            folder = os.path.join(self.media_root, 'movie/images/variants')
+            mtime = os.stat(folder).st_mtime_ns + 10 ** 9  # sistema de archivos con resolución de tiempo gruesa
+            os.utime(folder, ns=(mtime, mtime))
+            self.assertEqual(index.get('movie/images/m_Heat.png'),
+                             {'webp': [(160, 'movie/images/variants/m_Heat-160.webp')]})
+
+
+class RecommendationViewTests(TestCase):
+    # La vista asíncrona usa la base de datos solo desde el hilo compartido de sync_to_async,
+    # así que la transacción de cada prueba le es visible
+
+    def setUp(self):
+        temporary_data_dir(self)
+        self.provider = get_provider()
+        self.query = self.provider.embed(['space'])[0]
+        self.embedded_texts = {}
+
+        def create(title, description, genre, year, embedded_text):
+            movie = Movie.objects.create(title=title, description=description, genre=genre, year=year,
+                                         emb=to_blob(self.provider.embed([embedded_text])[0]),
+                                         emb_version=NORMALIZED, emb_backend=self.provider.key)
+            self.embedded_texts[movie.id] = embedded_text
+            return movie
+
+        self.alien = create('Alien', 'Space horror aboard a cargo ship', 'Horror', 1979, 'space horror ship')
+        self.cowboys = create('Space Cowboys', 'Old astronauts go back to space', 'Drama, Sci-Fi', 2000,
+                              'space astronauts')
+        self.heat = create('Heat', 'Crime in Los Angeles', 'Crime', 1995, 'crime los angeles')
+        # Coincide con "space" por palabras clave, pero su embedding no se parece a la consulta
+        self.lost = create('Lost in Space', 'A family lost in space', 'Comedy', 1998,
+                           'cooking recipes italian kitchen pasta')
+
+    def similarity(self, movie):
+        return float(self.query @ self.provider.embed([self.embedded_texts[movie.id]])[0])
+
+    def recommend(self, view, **params):
+        response = self.client.get(reverse(view), {'prompt': 'space', 'k': 4, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Error', response.context['error_message'] or '')
+        return response.context['movies']
+
+    def test_min_score_applies_to_keyword_matches(self):
+        min_score = 0.2
+        self.assertLess(self.similarity(self.lost), min_score)
+        self.assertGreaterEqual(self.similarity(self.alien), min_score)
+        for view in ('recommendations', 'recommendations_async'):
+            with self.subTest(view=view):
+                self.assertIn(self.lost, self.recommend(view))
+                movies = self.recommend(view, min_score=min_score)
+                self.assertIn(self.alien, movies)
+                self.assertNotIn(self.lost, movies)
+                for movie in movies:
+                    self.assertGreaterEqual(self.similarity(movie), min_score)
+
+    def test_keyword_index_sees_bulk_writes(self):
+        self.assertEqual(lexical_index.search('heat'), [(self.heat.id, mock.ANY)])
+        # Escritura en bloque como la de los comandos (sin señales, con catalog.touch): el save
+        # posterior no debe ocultar el cambio
+        self.heat.title = 'Collateral'
+        Movie.objects.bulk_update([self.heat], ['title'])
+        catalog.touch()
+        Movie.objects.create(title='Ronin', description='Heist in Paris', genre='Action', year=1998)
+        self.assertEqual(lexical_index.search('heat'), [])
+        self.assertEqual([movie_id for movie_id, _ in lexical_index.search('collateral')], [self.heat.id])
+
+    def test_saving_runs_no_catalog_query(self):
+        lexical_index.search('space')
+        with CaptureQueriesContext(connection) as queries:
+            self.heat.description = 'Heist in Los Angeles'
+            self.heat.save()
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        self.assertEqual([movie_id for movie_id, _ in lexical_index.search('heist')], [self.heat.id])
+
+    def test_filters_apply_to_both_rankings(self):
+        for view in ('recommendations', 'recommendations_async'):
+            with self.subTest(view=view):
+                self.assertEqual(self.recommend(view, genre='horror'), [self.alien])
+                self.assertEqual(self.recommend(view, genre='sci-fi'), [self.cowboys])
+                self.assertEqual(self.recommend(view, year_max=1990), [self.alien])
+                self.assertEqual(set(self.recommend(view, year_min=1996)), {self.cowboys, self.lost})
+                self.assertEqual(self.recommend(view, genre='comedy', year_max=1990), [])
+                self.assertEqual(self.recommend(view, genre='western'), [])
+
+    def test_async_scoring_runs_no_queries(self):
+        # Lo que va al pool de hilos (thread_sensitive=False) no debe abrir conexiones allí
+        lexical_results = views._lexical_search('space', 10, dict.fromkeys(('genre', 'year_min', 'year_max')))
+        filters = {'genre': 'sci-fi', 'year_min': None, 'year_max': None, 'min_score': 0.2}
+        data = views._exact_index_data(self.query, lexical_results, filters)
+        with self.assertNumQueries(0):
+            vector_results, lexical_results = views._vector_search(self.query, lexical_results, 10, filters, data)
+        self.assertEqual([movie_id for movie_id, _ in vector_results], [self.cowboys.id])
+        self.assertNotIn(self.lost.id, [movie_id for movie_id, _ in lexical_results])
+
+    def test_genre_options(self):
+        response = self.client.get(reverse('recommendations'))
+        self.assertEqual(response.context['genres'], ['comedy', 'crime', 'drama', 'horror', 'sci-fi'])
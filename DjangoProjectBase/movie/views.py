@@ -1,28 +1,58 @@
-from django.shortcuts import render
-from django.http import HttpResponse
-from .models import Movie
-import matplotlib.pyplot as plt
-import matplotlib
-import io
-import urllib, base64
-import os
-import numpy as np
-from openai import OpenAI
+from django.shortcuts import get_object_or_404, render
+from .models import Genre, Movie, MovieNeighbor
+from .index import embedding_index, search_movies
+from .cache import prompt_cache
+from . import charts, fts
+from .charts import chart_cache
+from .providers import get_provider
+from .lexical import lexical_index, reciprocal_rank_fusion
+from django.conf import settings
+from asgiref.sync import sync_to_async
+import asyncio
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv('api_keys.env')
 
+# Columnas que usa home.html: nunca se cargan emb ni los demás campos internos
+LISTING_FIELDS = ('id', 'title', 'description', 'image', 'url', 'genre', 'year')
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
 def home(request):
     #return HttpResponse('<h1>Welcome to Home Page</h1>')
     #return render(request, 'home.html')
     #return render(request, 'home.html', {'name':'Paola Vallejo'})
     searchTerm = request.GET.get('searchMovie') # GET se usa para solicitar recursos de un servidor
-    if searchTerm:
-        movies = Movie.objects.filter(title__icontains=searchTerm)
+    # Paginación por cursor (keyset): `after` es el id de la última película de la página anterior
+    page_size = min(max(_int_param(request, 'page_size', DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    after = _int_param(request, 'after')
+    listing = Movie.objects.only(*LISTING_FIELDS)
+
+    page_ids = fts.search(searchTerm, limit=page_size + 1, after=after) if searchTerm else None
+    if page_ids is not None:
+        # Búsqueda de texto completo (FTS5): ordenada por relevancia, sin acentos y por prefijos.
+        # La página sigue el orden del ranking, a partir de la película `after`
+        movies_by_id = listing.in_bulk(page_ids)
+        movies = [movies_by_id[movie_id] for movie_id in page_ids if movie_id in movies_by_id]
     else:
-        movies = Movie.objects.all()
-    return render(request, 'home.html', {'searchTerm':searchTerm, 'movies':movies})
+        if searchTerm:
+            listing = listing.filter(title__icontains=searchTerm)
+        if after is not None:
+            listing = listing.filter(id__gt=after)
+        movies = list(listing.order_by('id')[:page_size + 1])
+
+    # Se pide una película de más para saber si hay página siguiente
+    next_cursor = movies[page_size - 1].id if len(movies) > page_size else None
+    movies = movies[:page_size]
+    return render(request, 'home.html', {
+        'searchTerm': searchTerm,
+        'movies': movies,
+        'page_size': page_size,
+        'after': after,
+        'next_cursor': next_cursor,
+    })
 
 
 def about(request):
@@ -35,153 +65,188 @@ def signup(request):
 
 
 def statistics_view0(request):
-    matplotlib.use('Agg')
-    # Obtener todas las películas
-    all_movies = Movie.objects.all()
-
-    # Crear un diccionario para almacenar la cantidad de películas por año
-    movie_counts_by_year = {}
-
-    # Filtrar las películas por año y contar la cantidad de películas por año
-    for movie in all_movies:
-        year = movie.year if movie.year else "None"
-        if year in movie_counts_by_year:
-            movie_counts_by_year[year] += 1
-        else:
-            movie_counts_by_year[year] = 1
-
-    # Ancho de las barras
-    bar_width = 0.5
-    # Posiciones de las barras
-    bar_positions = range(len(movie_counts_by_year))
-
-    # Crear la gráfica de barras
-    plt.bar(bar_positions, movie_counts_by_year.values(), width=bar_width, align='center')
-
-    # Personalizar la gráfica
-    plt.title('Movies per year')
-    plt.xlabel('Year')
-    plt.ylabel('Number of movies')
-    plt.xticks(bar_positions, movie_counts_by_year.keys(), rotation=90)
-
-    # Ajustar el espaciado entre las barras
-    plt.subplots_adjust(bottom=0.3)
-
-    # Guardar la gráfica en un objeto BytesIO
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plt.close()
-
-    # Convertir la gráfica a base64
-    image_png = buffer.getvalue()
-    buffer.close()
-    graphic = base64.b64encode(image_png)
-    graphic = graphic.decode('utf-8')
+    # Contar la cantidad de películas por año (en la base de datos, con caché)
+    movie_counts_by_year = chart_cache.counts('year', charts.movie_counts_by_year)
+
+    # Crear la gráfica de barras (se reutiliza la imagen si los datos no cambiaron)
+    graphic = chart_cache.bar_chart(movie_counts_by_year, 'Year', 'Number of movies', title='Movies per year')
 
     # Renderizar la plantilla statistics.html con la gráfica
     return render(request, 'statistics.html', {'graphic': graphic})
 
 def statistics_view(request):
-    matplotlib.use('Agg')
+    # Los conteos se calculan en la base de datos (GROUP BY) y se guardan en caché
+    # hasta que cambie alguna película (ver movie/charts.py)
     # Gráfica de películas por año
-    all_movies = Movie.objects.all()
-    movie_counts_by_year = {}
-    for movie in all_movies:
-        print(movie.genre)
-        year = movie.year if movie.year else "None"
-        if year in movie_counts_by_year:
-            movie_counts_by_year[year] += 1
-        else:
-            movie_counts_by_year[year] = 1
-
+    movie_counts_by_year = chart_cache.counts('year', charts.movie_counts_by_year)
     year_graphic = generate_bar_chart(movie_counts_by_year, 'Year', 'Number of movies')
 
-    # Gráfica de películas por género
-    movie_counts_by_genre = {}
-    for movie in all_movies:
-        # Obtener el primer género
-        genres = movie.genre.split(',')[0].strip() if movie.genre else "None"
-        if genres in movie_counts_by_genre:
-            movie_counts_by_genre[genres] += 1
-        else:
-            movie_counts_by_genre[genres] = 1
-
+    # Gráfica de películas por género (primer género, columna indexada first_genre)
+    movie_counts_by_genre = chart_cache.counts('genre', charts.movie_counts_by_genre)
     genre_graphic = generate_bar_chart(movie_counts_by_genre, 'Genre', 'Number of movies')
 
     return render(request, 'statistics.html', {'year_graphic': year_graphic, 'genre_graphic': genre_graphic})
 
 
 def generate_bar_chart(data, xlabel, ylabel):
-    keys = [str(key) for key in data.keys()]
-    plt.bar(keys, data.values())
-    plt.title('Movies Distribution')
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.xticks(rotation=90)
-    plt.tight_layout()
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plt.close()
-    image_png = buffer.getvalue()
-    buffer.close()
-    graphic = base64.b64encode(image_png).decode('utf-8')
-    return graphic
+    # API orientada a objetos de matplotlib (sin estado global de pyplot); PNG en base64 cacheado por datos
+    return chart_cache.bar_chart(data, xlabel, ylabel)
 
-def recommendations_view(request):
+
+def get_prompt_embedding(prompt):
+    # El proveedor se elige en settings.MOVIE_EMBEDDING_BACKEND (ver movie/providers.py)
+    provider = get_provider()
+    if not provider.remote:
+        return provider.embed([prompt])[0]
+    return prompt_cache.get_or_compute(prompt, provider.key, lambda text: provider.embed([text])[0])
+
+
+async def get_prompt_embedding_async(prompt):
+    # Igual que get_prompt_embedding, pero sin bloquear el hilo mientras se espera a la API
+    provider = get_provider()
+    if not provider.remote:
+        return provider.embed([prompt])[0]
+    embedding = await sync_to_async(prompt_cache.get)(prompt, provider.key)
+    if embedding is not None:
+        return embedding
+    embedding = (await provider.aembed([prompt]))[0]
+    await sync_to_async(prompt_cache.set)(prompt, provider.key, embedding)
+    return embedding
+
+
+def _int_param(request, name, default=None):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _float_param(request, name, default=None):
+    try:
+        return float(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+
+
+MAX_RECOMMENDATIONS = 50
+
+
+def _recommendation_params(request):
     prompt = request.GET.get('prompt', '')
+    k = min(max(_int_param(request, 'k', 1), 1), MAX_RECOMMENDATIONS)
+    filters = {
+        'genre': request.GET.get('genre') or None,
+        'year_min': _int_param(request, 'year_min'),
+        'year_max': _int_param(request, 'year_max'),
+        'min_score': _float_param(request, 'min_score'),
+    }
+    return prompt, k, filters
+
+
+def _search_depth(k):
+    # Candidatos que se toman de cada ranking antes de fusionarlos
+    return max(k, settings.MOVIE_HYBRID_DEPTH) if settings.MOVIE_HYBRID_SEARCH else k
+
+
+def _lexical_search(prompt, depth, filters):
+    # Búsqueda por palabras clave (BM25): no necesita llamar a la API
+    if not settings.MOVIE_HYBRID_SEARCH:
+        return []
+    results = lexical_index.search(prompt, k=depth, genre=filters['genre'],
+                                   year_min=filters['year_min'], year_max=filters['year_max'])
+    print(f"Coincidencias por palabras clave: {len(results)}")
+    return results
+
+
+def _lexical_above_min_score(lexical_results, prompt_embedding, min_score, index=embedding_index):
+    # min_score es una similitud de coseno: las coincidencias por palabras clave también deben cumplirla
+    if min_score is None or not lexical_results:
+        return lexical_results
+    if prompt_embedding is None:
+        return []
+    similarity = index.similarities(prompt_embedding, [movie_id for movie_id, _ in lexical_results])
+    return [(movie_id, score) for movie_id, score in lexical_results
+            if similarity.get(movie_id, -1.0) >= min_score]
+
+
+def _exact_index_data(prompt_embedding, lexical_results, filters):
+    # Carga (y si hace falta reconstruye desde la base de datos) el índice exacto.
+    # None cuando la búsqueda no lo necesita: índice IVF cargado, sin filtros ni min_score
+    if prompt_embedding is None:
+        return None
+    filtered = filters['genre'] or filters['year_min'] is not None or filters['year_max'] is not None
+    needs_similarities = filters['min_score'] is not None and lexical_results
+    if settings.MOVIE_SEARCH_BACKEND == 'ivf' and not filtered and not needs_similarities:
+        from .ann import ann_index
+        if ann_index.usable(len(prompt_embedding)):
+            return None
+    return embedding_index.data()
+
+
+def _vector_search(prompt_embedding, lexical_results, depth, filters, data):
+    # Solo NumPy sobre un índice ya cargado: ninguna consulta a la base de datos
+    vector_results = []
+    if prompt_embedding is not None:
+        vector_results = search_movies(prompt_embedding, k=depth, data=data, **filters)
+    lexical_results = _lexical_above_min_score(lexical_results, prompt_embedding, filters['min_score'],
+                                               index=data if data is not None else embedding_index)
+    return vector_results, lexical_results
+
+
+def _fuse_results(vector_results, lexical_results, k):
+    # Fusionar ambos rankings por posición (reciprocal-rank fusion)
+    if lexical_results:
+        return reciprocal_rank_fusion([vector_results, lexical_results], k=settings.MOVIE_RRF_K)[:k]
+    return vector_results[:k]
+
+
+def _genre_names():
+    # Opciones del filtro de género desde la tabla Genre: no hace falta construir el índice de embeddings
+    return sorted({name.lower() for name in Genre.objects.values_list('name', flat=True)})
+
+
+def _no_results_message(filters):
+    if any(value is not None for value in filters.values()):
+        return "No se encontraron películas que cumplan los filtros."
+    return "No se encontraron películas con embeddings para comparar."
+
+
+def recommendations_view(request):
+    prompt, k, filters = _recommendation_params(request)
     movies = []
     error_message = None
     
     if prompt:
         try:
             print(f"Procesando prompt: {prompt}")
-            
-            # Obtener el embedding del prompt
-            api_key = os.environ.get('openai_apikey')
-            if not api_key:
-                raise ValueError("No se encontró la clave de API de OpenAI en las variables de entorno")
-            
-            client = OpenAI(api_key=api_key)
-            print("Cliente OpenAI creado")
-            
-            response = client.embeddings.create(
-                input=[prompt],
-                model="text-embedding-3-small"
-            )
-            prompt_embedding = np.array(response.data[0].embedding, dtype=np.float32)
-            print(f"Embedding del prompt generado, dimensiones: {prompt_embedding.shape}")
-            
-            # Obtener todas las películas
-            all_movies = Movie.objects.all()
-            print(f"Total de películas en la base de datos: {all_movies.count()}")
-            
-            # Calcular similitud con cada película
-            movie_similarities = []
-            for movie in all_movies:
-                if movie.emb:
-                    try:
-                        movie_embedding = np.frombuffer(movie.emb, dtype=np.float32)
-                        similarity = np.dot(prompt_embedding, movie_embedding) / (
-                            np.linalg.norm(prompt_embedding) * np.linalg.norm(movie_embedding)
-                        )
-                        movie_similarities.append((movie, similarity))
-                        print(f"Similitud calculada para {movie.title}: {similarity}")
-                    except Exception as e:
-                        print(f"Error procesando película {movie.title}: {str(e)}")
-                else:
-                    print(f"Película {movie.title} no tiene embedding")
-            
-            print(f"Total de similitudes calculadas: {len(movie_similarities)}")
-            
-            # Ordenar por similitud y tomar la más similar
-            movie_similarities.sort(key=lambda x: x[1], reverse=True)
-            if movie_similarities:
-                movies = [movie_similarities[0][0]]  # Solo tomar la primera película (la más similar)
-                print(f"Película recomendada seleccionada: {movies[0].title}")
+            depth = _search_depth(k)
+            lexical_results = _lexical_search(prompt, depth, filters)
+
+            # Obtener el embedding del prompt (desde la caché si ya se había calculado)
+            try:
+                prompt_embedding = get_prompt_embedding(prompt)
+            except Exception as e:
+                if not lexical_results:
+                    raise
+                # Sin embedding se muestran solo las coincidencias por palabras clave
+                print(f"Error generando el embedding, se usa solo BM25: {str(e)}")
+                prompt_embedding = None
+
+            # Buscar las k películas más similares; los filtros se aplican con máscaras sobre el índice
+            vector_results = []
+            if prompt_embedding is not None:
+                print(f"Embedding del prompt, dimensiones: {prompt_embedding.shape}")
+                print(f"Caché de prompts: {prompt_cache.stats()}")
+                vector_results = search_movies(prompt_embedding, k=depth, **filters)
+            lexical_results = _lexical_above_min_score(lexical_results, prompt_embedding, filters['min_score'])
+
+            results = _fuse_results(vector_results, lexical_results, k)
+            if results:
+                movies_by_id = Movie.objects.defer('emb').in_bulk([movie_id for movie_id, _ in results])
+                movies = [movies_by_id[movie_id] for movie_id, _ in results if movie_id in movies_by_id]
+                print(f"Películas recomendadas: {[movie.title for movie in movies]}")
             else:
-                error_message = "No se encontraron películas con embeddings para comparar."
+                error_message = _no_results_message(filters)
                 
         except Exception as e:
             error_message = f"Error generando recomendaciones: {str(e)}"
@@ -190,5 +255,67 @@ def recommendations_view(request):
     return render(request, 'recommendations.html', {
         'movies': movies,
         'prompt': prompt,
+        'k': k,
+        'filters': filters,
+        'genres': _genre_names(),
+        'error_message': error_message
+    })
+
+
+async def recommendations_async_view(request):
+    # Versión asíncrona para ASGI: mientras se espera a la API de OpenAI el
+    # worker sigue atendiendo otras peticiones. Todo lo que usa la base de datos
+    # (ORM, caché de prompts, cargar los índices) pasa por el hilo compartido de
+    # sync_to_async, cuya conexión Django sí cierra; solo el cálculo de las
+    # similitudes con NumPy va al pool de hilos (thread_sensitive=False).
+    prompt, k, filters = _recommendation_params(request)
+    movies = []
+    error_message = None
+
+    if prompt:
+        try:
+            depth = _search_depth(k)
+            lexical_results = await sync_to_async(_lexical_search)(prompt, depth, filters)
+
+            try:
+                prompt_embedding = await get_prompt_embedding_async(prompt)
+            except Exception as e:
+                if not lexical_results:
+                    raise
+                print(f"Error generando el embedding, se usa solo BM25: {e!r}")
+                prompt_embedding = None
+
+            data = await sync_to_async(_exact_index_data)(prompt_embedding, lexical_results, filters)
+            vector_results, lexical_results = await sync_to_async(_vector_search, thread_sensitive=False)(
+                prompt_embedding, lexical_results, depth, filters, data)
+
+            results = _fuse_results(vector_results, lexical_results, k)
+            if results:
+                movies_by_id = await Movie.objects.defer('emb').ain_bulk([movie_id for movie_id, _ in results])
+                movies = [movies_by_id[movie_id] for movie_id, _ in results if movie_id in movies_by_id]
+            else:
+                error_message = _no_results_message(filters)
+
+        except asyncio.TimeoutError:
+            error_message = "Error generando recomendaciones: la API de OpenAI no respondió a tiempo."
+        except Exception as e:
+            error_message = f"Error generando recomendaciones: {str(e)}"
+            print(f"Error: {str(e)}")
+
+    genres = await sync_to_async(_genre_names)()
+    return render(request, 'recommendations.html', {
+        'movies': movies,
+        'prompt': prompt,
+        'k': k,
+        'filters': filters,
+        'genres': genres,
         'error_message': error_message
-    })
\ No newline at end of file
+    })
+
+
+def similar_movies_view(request, movie_id):
+    # Vecinos precalculados con `python manage.py movie_neighbors`: una consulta indexada, sin llamadas a la API
+    movie = get_object_or_404(Movie.objects.defer('emb'), id=movie_id)
+    neighbors = (MovieNeighbor.objects.filter(movie_id=movie_id)
+                 .select_related('neighbor').defer('neighbor__emb').order_by('rank'))
+    return render(request, 'similar.html', {'movie': movie, 'neighbors': neighbors})
@@ -20,6 +20,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Files generated by the app (search indexes, caches); not served publicly
+DATA_DIR = BASE_DIR / 'data'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -30,7 +33,7 @@ SECRET_KEY = 'django-insecure-+9jg)*p09$at+zck$n-6*djf=34w4sc*m##^fmph4pb$_nh%xb
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
-ALLOWED_HOSTS = [54.86.232.79]
+ALLOWED_HOSTS = ['54.86.232.79']
 
 
 # Application definition
@@ -133,3 +136,72 @@ STATICFILES_DIRS = [
  os.path.join(BASE_DIR, "static"),
  'moviereviews/static/',
 ]
+
+
+# Movie recommendations search
+# 'exact' compares the prompt against every movie; 'ivf' uses the approximate
+# index built with `python manage.py build_ann_index`.
+
+MOVIE_SEARCH_BACKEND = 'exact'
+# 'database' decodes Movie.emb in every process; 'store' memory-maps the file
+# written by `python manage.py export_embeddings`, shared by all workers.
+MOVIE_EMBEDDING_SOURCE = 'database'
+MOVIE_EMBEDDING_STORE_DIR = DATA_DIR / 'embeddings'
+# 'float16' or 'int8' keeps a compressed copy of the matrix for candidate search;
+# the best k * MOVIE_INDEX_RESCORE_FACTOR candidates are rescored in float32.
+# Compare the options with `python manage.py benchmark_quantization`.
+MOVIE_INDEX_PRECISION = 'float32'
+MOVIE_INDEX_RESCORE_FACTOR = 10
+# Reduced-dimension candidate tier (None = disabled): 'truncate' keeps the
+# first dimensions, 'pca' uses the leading MOVIE_INDEX_REDUCED_DIM components of
+# the projection fitted by `python manage.py fit_pca`. If that file is missing or
+# does not match the embeddings, a warning is logged and search is exact float32.
+MOVIE_INDEX_REDUCED_DIM = None
+MOVIE_INDEX_REDUCTION = 'truncate'
+MOVIE_PCA_PATH = DATA_DIR / 'pca.npz'
+MOVIE_ANN_INDEX_PATH = DATA_DIR / 'ann_index.npz'
+# The in-memory indexes compare a fingerprint of the catalog (count, max id,
+# max emb_version and this stamp file, touched on every save and by the bulk
+# commands) at most every MOVIE_CATALOG_CHECK_INTERVAL seconds, and rebuild
+# when another process or a bulk write changed the movies.
+MOVIE_CATALOG_STAMP_PATH = DATA_DIR / 'catalog.stamp'
+MOVIE_CATALOG_CHECK_INTERVAL = 2
+# Number of k-means cells and of cells scanned per query (more = better recall, slower)
+MOVIE_ANN_NLIST = 64
+MOVIE_ANN_NPROBE = 8
+# Hybrid search: the vector ranking is fused with a BM25 keyword ranking over
+# title/description/genre (reciprocal-rank fusion, 1 / (MOVIE_RRF_K + rank)).
+MOVIE_HYBRID_SEARCH = True
+MOVIE_HYBRID_DEPTH = 20  # candidates taken from each ranking
+MOVIE_RRF_K = 60
+
+# Embedding provider (see movie/providers.py): 'openai' calls the OpenAI API,
+# 'hashing' encodes locally on the CPU (no network, lexical similarity only).
+# After switching, run `python manage.py movie_embeddings` to re-embed the catalog.
+MOVIE_EMBEDDING_BACKEND = 'openai'
+MOVIE_OPENAI_EMBEDDING_MODEL = 'text-embedding-3-small'
+MOVIE_HASHING_DIM = 1024
+# Seconds to wait for the OpenAI embeddings API before giving up
+MOVIE_EMBEDDING_TIMEOUT = 10
+
+# Cache of prompt embeddings: in-process LRU backed by a SQLite file
+MOVIE_PROMPT_CACHE_PATH = DATA_DIR / 'prompt_cache.sqlite3'
+MOVIE_PROMPT_CACHE_SIZE = 1024
+MOVIE_PROMPT_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+MOVIE_PROMPT_CACHE_MAX_ENTRIES = 100000
+
+# Cache of OpenAI responses shared by the management commands (completions,
+# embeddings, images), keyed by a hash of the request; LRU beyond the size limit.
+MOVIE_API_CACHE_PATH = DATA_DIR / 'api_cache.sqlite3'
+MOVIE_API_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Seconds the statistics counts are cached per process (saves in this process invalidate them at once)
+MOVIE_STATS_CACHE_TTL = 60
+
+# Poster variants (see movie/posters.py): resized copies served with srcset by
+# the {% poster %} template tag. Generate them with `python manage.py generate_poster_variants`.
+MOVIE_POSTER_WIDTHS = (160, 320, 480)
+MOVIE_POSTER_FORMATS = ('webp', 'jpeg')
+MOVIE_POSTER_QUALITY = 80
+# Render the variants of a movie's poster when it is saved
+MOVIE_POSTER_VARIANTS_ON_SAVE = True
@@ -28,6 +28,8 @@ urlpatterns = [
     path('news/', include('news.urls')),
     path('statistics/', movieViews.statistics_view, name='statistics'),
     path('recommendations/', movieViews.recommendations_view, name='recommendations'),
+    path('recommendations/async/', movieViews.recommendations_async_view, name='recommendations_async'),
+    path('movies/<int:movie_id>/similar/', movieViews.similar_movies_view, name='similar_movies'),
     path('signup/', movieViews.signup, name='signup'),
 ]
 
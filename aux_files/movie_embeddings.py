@@ -2,6 +2,7 @@ import os
 import numpy as np
 from django.core.management.base import BaseCommand
 from movie.models import Movie
+from movie.embeddings import NORMALIZED, normalize, to_blob
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -28,8 +29,9 @@ class Command(BaseCommand):
         for movie in movies:
             try:
                 emb = get_embedding(movie.description)
-                # ✅ Store embedding as binary in the database
-                movie.emb = emb.tobytes()
+                # ✅ Store the L2-normalized embedding as binary in the database
+                movie.emb = to_blob(normalize(emb))
+                movie.emb_version = NORMALIZED
                 movie.save()
                 self.stdout.write(self.style.SUCCESS(f"✅ Embedding stored for: {movie.title}"))
             except Exception as e:
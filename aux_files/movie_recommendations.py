@@ -22,20 +22,22 @@ def get_embedding(text, model="text-embedding-3-small"):
    text = text.replace("\n", " ")
    return client.embeddings.create(input = [text], model=model).data[0].embedding
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def normalize(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+#Los embeddings de las películas se normalizan una sola vez (norma L2 = 1), así la similitud
+#de coseno se reduce a un producto punto y se puede calcular para todas las películas a la vez.
+movie_matrix = normalize([movie['embedding'] for movie in movies])
 
 #Si se tuviera un prompt por ejemplo: Película de la segunda guerra mundial, podríamos generar el embedding del prompt y comparar contra 
 #los embeddings de cada una de las películas de la base de datos. La película con la similitud más alta al prompt sería la película
 #recomendada.
 
 req = "película de un pianista"
-emb = get_embedding(req)
+emb = normalize(get_embedding(req))
 
-sim = []
-for i in range(len(movies)):
-  sim.append(cosine_similarity(emb,movies[i]['embedding']))
-sim = np.array(sim)
+sim = movie_matrix @ emb
 idx = np.argmax(sim)
 print(movies[idx]['title'])
 
@@ -2,6 +2,7 @@ import os
 import numpy as np
 from django.core.management.base import BaseCommand
 from movie.models import Movie
+from movie.embeddings import normalize
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -22,10 +23,11 @@ class Command(BaseCommand):
                 input=[text],
                 model="text-embedding-3-small"
             )
-            return np.array(response.data[0].embedding, dtype=np.float32)
+            return normalize(response.data[0].embedding)
 
         def cosine_similarity(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+            # Los embeddings ya están normalizados: el coseno es el producto punto
+            return np.dot(a, b)
 
         # ✅ Generate embeddings of both movies
         emb1 = get_embedding(movie1.description)
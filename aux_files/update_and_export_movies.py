@@ -1,67 +1,63 @@
-
-import os
 import csv
-from openai import OpenAI
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from movie.models import Movie
+from movie.pipeline import Checkpoint, DescriptionGenerator, add_description_arguments, run_concurrently
 from dotenv import load_dotenv
 
 class Command(BaseCommand):
     help = "Update movie descriptions using OpenAI API and export to CSV"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        add_description_arguments(parser)
+        parser.add_argument('--output', type=str, default='updated_movie_descriptions.csv', help='CSV file to write')
+        parser.add_argument('--checkpoint', type=str,
+                            default=str(settings.DATA_DIR / 'checkpoints' / 'update_and_export_movies.jsonl'),
+                            help='File with the movies already exported, used to resume an interrupted run')
+
+    def handle(self, *args, **options):
         # ✅ Load environment variables
         load_dotenv('../openAI.env')
 
-        # ✅ Initialize OpenAI client
-        client = OpenAI(
-            api_key=os.environ.get('openai_apikey'),
-        )
-
-        # ✅ Helper function to get completion
-        def get_completion(prompt, model="gpt-3.5-turbo"):
-            messages = [{"role": "user", "content": prompt}]
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-            )
-            return response.choices[0].message.content.strip()
+        # ✅ OpenAI client, rate limiter and API cache (retries are handled by call_with_retries)
+        get_completion = DescriptionGenerator.from_options(options)
+        checkpoint = Checkpoint(options['checkpoint'], restart=options['restart'])
 
-        # ✅ Instruction for the AI
-        instruction = (
-            "Vas a actuar como un aficionado del cine que sabe describir de forma clara, "
-            "concisa y precisa cualquier película en menos de 200 palabras. La descripción "
-            "debe incluir el género de la película y cualquier información adicional que sirva "
-            "para crear un sistema de recomendación."
-        )
+        # ✅ Fetch the movies not exported yet
+        movies = Movie.objects.only('id', 'title', 'description').order_by('id')
+        pending = [movie for movie in movies.iterator() if movie.id not in checkpoint]
+        self.stdout.write(f"Found {movies.count()} movies, {len(pending)} to export")
 
-        # ✅ Fetch all movies
-        movies = Movie.objects.all()
-        self.stdout.write(f"Found {movies.count()} movies")
-
-        # ✅ Prepare CSV file
-        output_file = 'updated_movie_descriptions.csv'
-        with open(output_file, mode='w', newline='', encoding='utf-8') as csvfile:
+        # ✅ Prepare CSV file: a new one unless a checkpoint is being resumed
+        output_file = options['output']
+        new_file = not checkpoint.done
+        failed = 0
+        with open(output_file, mode='w' if new_file else 'a', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(['Title', 'Updated Description'])  # Header
-
-            # ✅ Process each movie and write to CSV
-            for movie in movies:
-                self.stdout.write(f"Processing: {movie.title}")
-                try:
-                    prompt = (
-                        f"{instruction} "
-                        f"Vas a actualizar la descripción '{movie.description}' de la película '{movie.title}'."
-                    )
-                    updated_description = get_completion(prompt)
-
-                    # ✅ Write title and updated description to CSV
+            if new_file:
+                writer.writerow(['Title', 'Updated Description'])  # Header
+
+            # ✅ Process the movies concurrently and stream each row to the CSV
+            try:
+                for movie, updated_description, error in run_concurrently(pending, get_completion,
+                                                                          options['workers']):
+                    if error is not None:
+                        failed += 1
+                        self.stderr.write(f"Failed for {movie.title}: {str(error)}")
+                        continue
                     writer.writerow([movie.title, updated_description])
-
+                    csvfile.flush()
+                    checkpoint.mark([movie.id])
                     self.stdout.write(self.style.SUCCESS(f"Updated and saved: {movie.title}"))
-
-                except Exception as e:
-                    self.stderr.write(f"Failed for {movie.title}: {str(e)}")
-
-        self.stdout.write(self.style.SUCCESS(f"All movie descriptions updated and saved to {output_file}"))
+            except BaseException:
+                checkpoint.close()
+                raise
+
+        # ✅ Every movie exported: the next run starts a new CSV
+        if failed:
+            checkpoint.close()
+            self.stdout.write(self.style.WARNING(
+                f"{failed} movies failed; run the command again to export them to {output_file}"))
+        else:
+            checkpoint.finish()
+            self.stdout.write(self.style.SUCCESS(f"All movie descriptions updated and saved to {output_file}"))